@@ -0,0 +1,31 @@
+""" Benchmarks for writing trial records and session parameters.
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+from pathlib import Path
+
+# Import custom modules
+from models import csvmodel
+from models import sessionmodel
+
+
+##############
+# Benchmarks #
+##############
+def bench_save_record(benchmark, sessionpars, tmp_path, monkeypatch):
+    # Data folder is created in the working directory
+    monkeypatch.chdir(tmp_path)
+    csv_model = csvmodel.CSVModel(sessionpars)
+    benchmark(csv_model.save_record)
+    assert csv_model.file.exists()
+
+
+def bench_sessionpars_save(benchmark, tmp_path, monkeypatch):
+    # Keep the user's settings file out of it
+    monkeypatch.setattr(Path, 'home', lambda: tmp_path)
+    model = sessionmodel.SessionParsModel()
+    benchmark(model.save)
+    assert model.filepath.exists()
@@ -0,0 +1,128 @@
+""" Benchmarks for the level scaling, normalizing and clipping
+    checks done before audio is presented.
+"""
+
+###########
+# Imports #
+###########
+# Import data science packages
+import numpy as np
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import audiomodel
+
+
+############
+# Fixtures #
+############
+@pytest.fixture(scope='module', params=[(0.002, 1), (1.0, 2), (10.0, 2)],
+                ids=['tick', '1s-stereo', '10s-stereo'])
+def audio(request, make_wav):
+    dur, channels = request.param
+    return audiomodel.Audio(make_wav(fs=48000, dur=dur, channels=channels))
+
+
+##############
+# Benchmarks #
+##############
+def bench_prepare_scaled(benchmark, audio):
+    temp = benchmark(audio.prepare, -10.0)
+    assert temp.dtype == np.float32
+
+
+def bench_prepare_normalized(benchmark, audio):
+    if audio.num_channels == 1:
+        pytest.skip("normalizing needs a 2-D signal")
+    benchmark(audio.prepare)
+
+
+def bench_prepare_clipping(benchmark, audio):
+    # +30 dB takes a -20 dB FS peak over full scale
+    def run():
+        with pytest.raises(Exception, match="Clipping"):
+            audio.prepare(30.0)
+    benchmark(run)
+
+
+def bench_play(benchmark, audio, null_sink):
+    benchmark(audio.play, level=-10.0, device_id=0, speaker=1)
+    assert null_sink.buffers > 0
+
+
+@pytest.mark.parametrize('shape', [(48000,), (2, 48000), (2, 480000)],
+                         ids=['mono-1s', 'stereo-1s', 'stereo-10s'])
+def bench_setRMS(benchmark, make_wav, shape):
+    audio = audiomodel.Audio(make_wav())
+    sig = np.random.default_rng(0).uniform(-0.1, 0.1, shape)
+    benchmark(audio.setRMS, sig, -25.0)
+
+
+#################################
+# Level normalization (set_rms) #
+#################################
+def legacy_setRMS(sig, amp, eq='n'):
+    """ setRMS as it was before set_rms, kept as a reference
+        (2-channel branch only)
+    """
+    a = audiomodel.Audio
+    rmsdbLeft = a.mag2db(a.rms(sig[0]))
+    rmsdbRight = a.mag2db(a.rms(sig[1]))
+    ILD = np.abs(rmsdbLeft - rmsdbRight)
+    diffdbLeft = np.abs(rmsdbLeft - amp)
+    diffdbRight = np.abs(rmsdbRight - amp)
+    if rmsdbLeft > amp:
+        sigAdjLeft = sig[0] / a.db2mag(diffdbLeft)
+    else:
+        sigAdjLeft = sig[0] * a.db2mag(diffdbLeft)
+    if rmsdbRight > amp:
+        sigAdjRight = sig[1] / a.db2mag(diffdbRight)
+    else:
+        sigAdjRight = sig[1] * a.db2mag(diffdbRight)
+    if eq == 'n':
+        if rmsdbLeft > rmsdbRight:
+            sigAdjLeft = sigAdjLeft * a.db2mag(ILD/2)
+            sigAdjRight = sigAdjRight / a.db2mag(ILD/2)
+        elif rmsdbRight > rmsdbLeft:
+            sigAdjLeft = sigAdjLeft / a.db2mag(ILD/2)
+            sigAdjRight = sigAdjRight * a.db2mag(ILD/2)
+    return np.array([sigAdjLeft, sigAdjRight])
+
+
+@pytest.fixture(scope='module', params=[1, 5], ids=['1min', '5min'])
+def long_stereo(request):
+    """ Multi-minute 2-channel signal at 48 kHz, channels first,
+        with a 6 dB level difference
+    """
+    n = request.param * 60 * 48000
+    sig = np.random.default_rng(0).uniform(-0.1, 0.1, (2, n))
+    sig[1] *= 0.5
+    return sig
+
+
+@pytest.mark.benchmark(group='set_rms')
+def bench_set_rms_legacy(benchmark, long_stereo):
+    benchmark(legacy_setRMS, long_stereo, -25.0)
+
+
+@pytest.mark.benchmark(group='set_rms')
+def bench_set_rms(benchmark, long_stereo):
+    out = benchmark(audiomodel.Audio.set_rms, long_stereo, -25.0)
+    assert np.allclose(out, legacy_setRMS(long_stereo, -25.0))
+
+
+@pytest.mark.benchmark(group='set_rms')
+def bench_set_rms_float32_inplace(benchmark, long_stereo):
+    # (frames, channels) float32, as played
+    sig = np.ascontiguousarray(long_stereo.T, dtype=np.float32)
+    benchmark(audiomodel.Audio.set_rms, sig, -25.0, axis=0, out=sig)
+
+
+@pytest.mark.benchmark(group='set_rms')
+@pytest.mark.parametrize('channels', [8, 32])
+def bench_set_rms_multichannel(benchmark, channels):
+    sig = np.random.default_rng(0).uniform(
+        -0.1, 0.1, (60 * 48000, channels)).astype(np.float32)
+    benchmark(audiomodel.Audio.set_rms, sig, -25.0, axis=0, out=sig)
@@ -0,0 +1,36 @@
+""" Throughput of the SPSC ring buffer.
+
+    Correctness (wrap-around, counters, threaded stress runs and
+    the no-allocation check) is covered in tests/test_ringbuffer.py.
+"""
+
+###########
+# Imports #
+###########
+# Import data science packages
+import numpy as np
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import ringbuffermodel
+
+
+##############
+# Benchmarks #
+##############
+@pytest.mark.parametrize('block', [64, 512, 4096])
+def bench_write_read(benchmark, block):
+    ring = ringbuffermodel.RingBuffer(8 * block, channels=2)
+    data = np.ones((block, 2), dtype=np.float32)
+    out = np.empty_like(data)
+    ring.gain = 0.5
+
+    def cycle():
+        ring.write(data)
+        ring.read_into(out)
+
+    benchmark(cycle)
+    assert ring.overruns == 0 and ring.underruns == 0
+    assert np.all(out == 0.5)
@@ -0,0 +1,73 @@
+""" Benchmarks for stimulus loading and tick train creation.
+"""
+
+###########
+# Imports #
+###########
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import audiomodel
+from models import synthmodel
+from models import tickmodel
+
+
+##############
+# Benchmarks #
+##############
+@pytest.mark.parametrize('fs', [22050, 44100, 48000, 96000])
+@pytest.mark.parametrize('isi', [20.0, 60.0, 200.0])
+@pytest.mark.parametrize('train_reps', [1, 10, 100])
+def bench_make_train(benchmark, make_wav, sessionpars, fs, isi, train_reps):
+    audio = audiomodel.Audio(make_wav(fs=fs))
+    sessionpars['isi'].set(isi)
+    sessionpars['train_reps'].set(train_reps)
+
+    # A new TickModel per round, as in Application._create_stimulus
+    def run():
+        return tickmodel.TickModel(sessionpars, audio).make_train()
+
+    train = benchmark(run)
+    assert train.ndim == 1
+
+
+@pytest.mark.parametrize('isi', [1.0, 5.0, 20.0])
+@pytest.mark.parametrize('train_reps', [100, 1000])
+def bench_make_train_rapid(benchmark, make_wav, sessionpars, isi, train_reps):
+    # Onset-to-onset ISIs down to shorter than the tick (overlaps)
+    audio = audiomodel.Audio(make_wav(fs=48000, dur=0.01))
+    sessionpars['isi'].set(isi)
+    sessionpars['jitter'].set(0.0)
+    sessionpars['train_reps'].set(train_reps)
+    sessionpars['isi_mode'].set('onset')
+
+    def run():
+        return tickmodel.TickModel(sessionpars, audio).make_train()
+
+    train = benchmark(run)
+    assert len(train) >= train_reps * int(isi / 1000 * audio.fs)
+
+
+@pytest.mark.parametrize('source', ['click', 'tone_pip', 'noise'])
+def bench_synth_train(benchmark, sessionpars, source):
+    # Procedural tick: no file I/O, kernel cached after the first round
+    sessionpars['stim_source'].set(source)
+
+    def run():
+        audio = synthmodel.SynthModel(sessionpars).make_audio()
+        return tickmodel.TickModel(sessionpars, audio).make_train()
+
+    train = benchmark(run)
+    assert train.ndim == 1
+
+
+@pytest.mark.parametrize('dur,channels', [
+    (0.002, 1),     # single tick
+    (1.0, 2),       # calibration stimulus
+    (60.0, 2),      # long recording
+], ids=['tick', '1s-stereo', '60s-stereo'])
+def bench_audio_init(benchmark, make_wav, dur, channels):
+    path = make_wav(fs=48000, dur=dur, channels=channels)
+    audio = benchmark(audiomodel.Audio, path)
+    assert audio.num_channels == channels
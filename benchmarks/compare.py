@@ -0,0 +1,107 @@
+""" Compare two saved benchmark runs and flag regressions.
+
+    With no file arguments, the two most recent runs saved by
+    --benchmark-autosave (in .benchmarks under the folder the
+    benchmarks were run from) are compared, older = baseline.
+
+    Usage:
+        python benchmarks/compare.py [BASELINE.json CURRENT.json]
+            [--threshold 10] [--stat median]
+
+    Exits with status 1 if any benchmark got slower by more than
+    the threshold (percent).
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Import data handling packages
+import json
+
+
+#########
+# Funcs #
+#########
+def latest_runs(storage='.benchmarks', count=2):
+    """ Return the paths of the most recent saved runs, 
+        oldest first
+    """
+    storage = Path(storage)
+    runs = sorted(storage.glob('*/*.json'), key=os.path.getmtime)
+    if len(runs) < count:
+        raise FileNotFoundError(
+            f"compare: Need {count} saved runs in {storage}, " +
+            f"found {len(runs)}. Run with --benchmark-autosave first.")
+    return runs[-count:]
+
+
+def load_stats(path, stat='median'):
+    """ Return {benchmark name: stat (seconds)} for a saved run
+    """
+    with open(path, 'r') as fh:
+        data = json.load(fh)
+    return {b['fullname']: b['stats'][stat] for b in data['benchmarks']}
+
+
+def compare(baseline, current, threshold=10.0):
+    """ Return a list of (name, old, new, change %) rows, one per 
+        benchmark found in both runs, plus the names that got 
+        slower by more than threshold percent
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name], current[name]
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append((name, old, new, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Flag benchmarks that got slower between two runs.")
+    parser.add_argument('files', nargs='*',
+        help="baseline and current .json (default: latest two saved)")
+    parser.add_argument('--threshold', type=float, default=10.0,
+        help="allowed slowdown (percent)")
+    parser.add_argument('--stat', default='median',
+        choices=['min', 'median', 'mean', 'max'])
+    parser.add_argument('--storage', default='.benchmarks',
+        help="folder of saved runs (default: .benchmarks)")
+    args = parser.parse_args(argv)
+
+    if len(args.files) not in (0, 2):
+        parser.error("give both BASELINE and CURRENT, or neither")
+    baseline_path, current_path = args.files or latest_runs(args.storage)
+
+    baseline = load_stats(baseline_path, args.stat)
+    current = load_stats(current_path, args.stat)
+    rows, regressions = compare(baseline, current, args.threshold)
+
+    print(f"compare: {baseline_path} -> {current_path} ({args.stat})")
+    width = max((len(r[0]) for r in rows), default=0)
+    for name, old, new, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<{width}}  {old*1e6:>12.1f} us  " +
+            f"{new*1e6:>12.1f} us  {change:+7.1f}%{flag}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"compare: Only in one run: {name}")
+
+    if regressions:
+        print(f"\ncompare: {len(regressions)} regression(s) over " +
+            f"{args.threshold:g}%")
+        return 1
+    print("\ncompare: No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
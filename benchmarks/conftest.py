@@ -0,0 +1,93 @@
+""" Shared fixtures for the benchmark suite.
+
+    Benchmarks run without audio hardware or a Tk display: WAV 
+    files are generated in a temp folder, session parameters are
+    plain Vars (functions.headless) and Audio buffers go to a 
+    null sink instead of the sound card.
+
+    Run from the project folder:
+        python -m pytest -c benchmarks/pytest.ini benchmarks --benchmark-autosave
+    then compare the two most recent runs:
+        python benchmarks/compare.py
+
+    Requires pytest-benchmark. PortAudio is not (see
+    functions.portaudio).
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import os
+import sys
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+import soundfile as sf
+
+# Import testing packages
+import pytest
+
+# Make the project packages importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import custom modules
+from models import audiomodel
+from functions import headless
+
+
+#########
+# Funcs #
+#########
+def write_wav(path, fs, dur, channels=1, seed=0):
+    """ Write a noise burst (-20 dB FS peak) to path
+    """
+    rng = np.random.default_rng(seed)
+    sig = rng.uniform(-0.1, 0.1, (int(fs * dur), channels))
+    sf.write(path, sig.squeeze(), fs)
+    return path
+
+
+@pytest.fixture(scope='session')
+def wav_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp('wavs')
+
+
+@pytest.fixture(scope='session')
+def make_wav(wav_dir):
+    """ Factory for cached WAV files: make_wav(fs, dur, channels)
+    """
+    made = {}
+    def _make(fs=48000, dur=0.002, channels=1):
+        key = (fs, dur, channels)
+        if key not in made:
+            name = f"noise_{fs}_{dur}_{channels}.wav"
+            made[key] = write_wav(wav_dir / name, fs, dur, channels)
+        return made[key]
+    return _make
+
+
+@pytest.fixture
+def sessionpars():
+    return headless.make_sessionpars()
+
+
+class NullSink:
+    """ Audio sink that drops buffers
+    """
+    def __init__(self):
+        self.buffers = 0
+
+    def __call__(self, buffer, fs, device_id, speaker):
+        self.buffers += 1
+
+
+@pytest.fixture(autouse=True)
+def null_sink(monkeypatch):
+    """ Keep every benchmark away from the sound card
+    """
+    sink = NullSink()
+    monkeypatch.setattr(audiomodel.Audio, 'sink', sink)
+    return sink
@@ -0,0 +1,24 @@
+""" Test configuration for the project folder.
+
+    Puts the project folder on sys.path so the tests import the
+    project packages (models, functions, ...) however pytest is
+    started:
+        pytest tests
+        python -m pytest tests
+
+    Written by: Travis M. Moore
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import os
+import sys
+
+
+#########
+# BEGIN #
+#########
+# Make the project packages importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
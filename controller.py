@@ -19,16 +19,22 @@ from tkinter import messagebox
 import os
 from pathlib import Path
 import random
+import argparse
+import tempfile
+import multiprocessing
+import re
+
+# Import audio packages
+from functions.portaudio import sd
 
 # Import misc packages
 import webbrowser
-import markdown
 
 # Import custom modules
 # Menu imports
 from menus import mainmenu
 # Function imports
-from functions import functions
+from functions import assets
 # Model imports
 from models import sessionmodel
 from models import audiomodel
@@ -36,6 +42,14 @@ from models import calmodel
 from models import csvmodel
 from models import updatermodel
 from models import tickmodel
+from models import helpmodel
+from models import simmodel
+from models import memprofilemodel
+from models import realtimemodel
+from models import enginemodel
+from models import stationmodel
+from models import synthmodel
+from models import tunermodel
 # View imports
 from views import mainview
 from views import sessionview
@@ -49,7 +63,8 @@ from views import calibrationview
 class Application(tk.Tk):
     """ Application root window
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, check_updates=True, memprofile=None, 
+                 station=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         #############
@@ -74,12 +89,20 @@ class Application(tk.Tk):
         self.withdraw() # Hide window during setup
         self.resizable(False, False)
         self.title(self.NAME)
+        if station:
+            self.title(f"{self.NAME} - Station {station}")
 
         # Assign special quit function on window close
         # Used to close Vulcan session cleanly even if 
         # user closes window via "X"
         self.protocol('WM_DELETE_WINDOW', self._quit)
 
+        # Optional memory profiler (memprofile is the report path)
+        self.memprofiler = None
+        if memprofile:
+            self.memprofiler = memprofilemodel.MemoryProfiler(memprofile)
+            self.memprofiler.start()
+
         # Data dictionary
         self._vars = {
             'button_id': tk.StringVar()
@@ -87,14 +110,20 @@ class Application(tk.Tk):
 
         # Load current session parameters from file
         # Or load defaults if file does not exist yet
-        self.sessionpars_model = sessionmodel.SessionParsModel()
+        self.sessionpars_model = sessionmodel.SessionParsModel(station)
         self._load_sessionpars()
 
         # Load CSV writer model
-        self.csvmodel = csvmodel.CSVModel(self.sessionpars)
+        self.csvmodel = csvmodel.CSVModel(self.sessionpars, station)
 
         # Load calibration model
-        self.calmodel = calmodel.CalModel(self.sessionpars)
+        self.calmodel = calmodel.CalModel(self.sessionpars, station=station)
+
+        # Play with each device's tuned stream settings
+        audiomodel.Audio.profiles = self.calmodel.profiles
+
+        # Load help model
+        self.helpmodel = helpmodel.HelpModel()
 
         # Load main view
         self.main_frame = mainview.MainFrame(self, self._vars)
@@ -108,6 +137,12 @@ class Application(tk.Tk):
         tk.Label(self, textvariable=self.trial_var).grid(
             row=1, column=0, sticky='w', padx=10)
 
+        # Presentations of the current trial (stream status counts)
+        self._presentations = []
+
+        # Stream tuner while a tuning run is in progress
+        self._tuner = None
+
         # Load menus
         menu = mainmenu.MainMenu(self, self._menu_settings)
         self.config(menu=menu)
@@ -122,6 +157,7 @@ class Application(tk.Tk):
             # Tools menu
             '<<ToolsAudioSettings>>': lambda _: self._show_audio_dialog(),
             '<<ToolsCalibration>>': lambda _: self._show_calibration_dialog(),
+            '<<ToolsTuneDevice>>': lambda _: self._tune_device(),
 
             # Playback menu
             '<<PlaybackStop>>': lambda _: self.stop_audio(),
@@ -137,9 +173,10 @@ class Application(tk.Tk):
             '<<CalPlay>>': lambda _: self.play_calibration_file(),
             '<<CalStop>>': lambda _: self.stop_calibration_file(),
             '<<CalibrationSubmit>>': lambda _: self._calc_offset(),
+            '<<CalibrationReset>>': lambda _: self.calmodel.reset_route(),
 
             # Audio dialog commands
-            '<<AudioDialogSubmit>>': lambda _: self._save_sessionpars(),
+            '<<AudioDialogSubmit>>': lambda _: self._on_audio_dialog_submit(),
 
             # Main View commands
             '<<MainStart>>': lambda _: self._on_start(),
@@ -156,12 +193,14 @@ class Application(tk.Tk):
         self.center_window()
 
         # Check for updates
-        if self.sessionpars['check_for_updates'].get() == 'yes':
+        # Runs in the background: the result arrives via after()
+        if check_updates and \
+                self.sessionpars['check_for_updates'].get() == 'yes':
             #_filepath = r'\\starfile\Public\Temp\MooreT\Custom Software\version_library.csv'
             _filepath = self.sessionpars['update_path'].get()
-            u = updatermodel.VersionChecker(_filepath, self.NAME, self.VERSION)
-            if not u.current:
-                self.destroy()
+            self.updater = updatermodel.VersionChecker(
+                _filepath, self.NAME, self.VERSION)
+            self.updater.start(self, self._on_update_check)
 
 
     #####################
@@ -180,20 +219,52 @@ class Application(tk.Tk):
         self.deiconify()
 
 
+    def _on_update_check(self, current):
+        """ Called by the version checker once the check is done.
+            Kill app if a mandatory update is available.
+        """
+        if not current:
+            self.destroy()
+
+
     def _quit(self):
         """ Quit application.
         """
+        # Write memory report
+        if self.memprofiler is not None:
+            self.memprofiler.write_report()
+
+        # Stop the audio engine process
+        if audiomodel.Audio.engine is not None:
+            audiomodel.Audio.engine.close()
+            audiomodel.Audio.engine = None
+
+        # Remove the shared stimuli this station decoded
+        if audiomodel.Audio.store is not None:
+            audiomodel.Audio.store.close()
+            audiomodel.Audio.store = None
+
+        # Turn GC back on, unlock buffers and report what was applied
+        if audiomodel.Audio.realtime is not None:
+            audiomodel.Audio.realtime.release()
+            print("\n" + "\n".join(audiomodel.Audio.realtime.report()))
+            audiomodel.Audio.realtime = None
+
         # Quit app
         self.destroy()
 
 
+    def _mem_snapshot(self, event):
+        """ Take a memory snapshot if profiling is on.
+        """
+        if self.memprofiler is not None:
+            self.memprofiler.snapshot(f"trial {self.counter} {event}")
+
+
     def _play(self):
+        # No stimulus has been created yet
         try:
-            self.a.play(
-                level=self.sessionpars['scaling_factor'].get(),
-                device_id=self.sessionpars['audio_device'].get(),
-                speaker=self.sessionpars['speaker_number'].get()
-            )
+            audio = self.a
         except AttributeError:
             messagebox.showerror(
                 title="No Audio File",
@@ -202,6 +273,56 @@ class Application(tk.Tk):
                     "\nAborting!"
             )
             self.destroy()
+            return
+
+        presentation = audio.play(
+            level=self.sessionpars['scaling_factor'].get(),
+            device_id=self.sessionpars['audio_device'].get(),
+            speaker=self.sessionpars['speaker_number'].get(),
+            preroll=self.sessionpars['presentation_preroll'].get() / 1000
+        )
+
+        # Keep for the trial's stream status counts (None: nothing
+        # was played)
+        if presentation is not None:
+            self._presentations.append(presentation)
+
+
+    def _stream_status(self):
+        """ Sum the stream status counts of this trial's 
+            presentations, and add the DAC onset of the last one
+            and the latest onset (columns for the data file).
+        """
+        status = {
+            'presentations': len(self._presentations),
+            'callbacks': 0,
+            'underflows': 0,
+            'priming_callbacks': 0,
+            'late_callbacks': 0,
+            'stream_errors': 0,
+        }
+        stats = [p.stats() for p in self._presentations]
+        if any(s is None for s in stats):
+            # Played without a visible stream (sink), or the engine
+            # did not answer: counts are unknown, not zero
+            for key in list(status)[1:]:
+                status[key] = 'n/a'
+        else:
+            for presentation in stats:
+                for key, value in presentation.items():
+                    status[key] += value
+
+        onsets = [p.onset() for p in self._presentations]
+        status['onset_time'] = 'n/a'
+        status['max_onset_error_ms'] = 'n/a'
+        if onsets and onsets[-1] is not None \
+                and onsets[-1]['onset_time'] is not None:
+            status['onset_time'] = onsets[-1]['onset_time']
+        errors = [o['onset_error_ms'] for o in onsets
+            if o is not None and o['onset_error_ms'] is not None]
+        if errors:
+            status['max_onset_error_ms'] = max(errors)
+        return status
 
 
     #######################
@@ -239,6 +360,9 @@ class Application(tk.Tk):
         # Update sessionpars['scaling_factor'] with starting level
         self._set_starting_level()
 
+        # New trial: new stream status counts
+        self._presentations = []
+
         try:
             self._create_stimulus()
         except FileNotFoundError:
@@ -247,10 +371,15 @@ class Application(tk.Tk):
                 message="No audio file found!"
             )
             return
+        except ValueError as e:
+            self._show_stimulus_error(e)
+            return
 
         # Play stimulus
         self._play()
 
+        self._mem_snapshot('start')
+
 
     def _create_stimulus(self):
         """ Create audio object and pass it to tick stimulus model.
@@ -258,15 +387,40 @@ class Application(tk.Tk):
         print(f"\ncontroller: Creating new stimulus instance")
         try:
             # Create stimulus
-            self.a = audiomodel.Audio(Path(self.sessionpars['stim_file_path'].get()))
+            if self.sessionpars['stim_source'].get() == 'file':
+                self.a = audiomodel.Audio(Path(self.sessionpars['stim_file_path'].get()))
+            else:
+                self.a = synthmodel.SynthModel(self.sessionpars).make_audio()
             t = tickmodel.TickModel(self.sessionpars, self.a)
             train = t.make_train()
             self.a.signal = train
+
+            # Trigger pulses at the tick onsets, on their own channel
+            trigger = self.sessionpars['trigger_channel'].get()
+            if trigger > 0:
+                if trigger == self.sessionpars['speaker_number'].get():
+                    print("controller: Trigger channel is the speaker " +
+                        "channel! No trigger pulses.")
+                else:
+                    self.a.marker = t.make_marker(
+                        self.sessionpars['trigger_width'].get())
+                    self.a.marker_channel = trigger
         except FileNotFoundError:
             print("\ncontroller: Cannot find audio! Aborting.")
             raise
 
 
+    def _show_stimulus_error(self, error):
+        """ Report stimulus settings that cannot be rendered.
+        """
+        print(f"\ncontroller: {error}")
+        messagebox.showerror(
+            title="Invalid Stimulus Settings",
+            message="Cannot create the stimulus!",
+            detail=f"{error}\nPlease check the session parameters."
+        )
+
+
     def _reset_arrow_message(self):
         """ Changes the label frame title to the default.
             Used after an upper/lower limit notification.
@@ -278,10 +432,10 @@ class Application(tk.Tk):
     def _check_limits(self, scaling):
         """ Check that scaling factor is within limits.
         """
-        max = self.sessionpars['max_output'].get() - \
-            self.sessionpars['slm_offset'].get()
-        min = self.sessionpars['min_output'].get() - \
-            self.sessionpars['slm_offset'].get()
+        max, min = self.calmodel.spl_to_dbfs([
+            self.sessionpars['max_output'].get(),
+            self.sessionpars['min_output'].get()
+        ])
         if scaling > max:
             scaling = max
             self.main_frame.arrow_frm_text.set('UPPER LIMIT')
@@ -320,7 +474,8 @@ class Application(tk.Tk):
 
         # Save scaling factor
         self.sessionpars['scaling_factor'].set(scaling)
-        self.sessionpars['db_level'].set(scaling + self.sessionpars['slm_offset'].get())
+        self.sessionpars['db_level'].set(
+            float(self.calmodel.dbfs_to_spl(scaling)))
         print(f"controller: New scaling factor: {scaling}")
         print(f"controller: New dB level: {self.sessionpars['db_level'].get()}")
 
@@ -339,7 +494,9 @@ class Application(tk.Tk):
         # Save data
         print('controller: Calling save record function...')
         #self.csvmodel.save_record(data)
-        self.csvmodel.save_record()
+        self.csvmodel.save_record(extra=self._stream_status())
+
+        self._mem_snapshot('save')
 
         # Increase counter and check for end of task
         self.counter += 1
@@ -349,7 +506,7 @@ class Application(tk.Tk):
                 message="You have finished this task.",
                 detail="Please wait for the investigator."
             )
-            self.destroy()
+            self._quit()
 
 
     ############################
@@ -400,6 +557,9 @@ class Application(tk.Tk):
                 message="No audio file found!"
             )
             return
+        except ValueError as e:
+            self._show_stimulus_error(e)
+            return
 
         name = f"isi{self.sessionpars['isi'].get()}_" + \
             f"jitter{self.sessionpars['jitter'].get()}_" + \
@@ -416,6 +576,21 @@ class Application(tk.Tk):
         print("\ncontroller: Calling audio dialog...")
         audioview.AudioDialog(self, self.sessionpars)
 
+
+    def _on_audio_dialog_submit(self):
+        """ Pick up the stored offset for the new device/speaker 
+            route and save.
+        """
+        route = self.calmodel.profiles.get_route(*self.calmodel._route())
+        if route is None:
+            print("\ncontroller: No calibration stored for this route! " +
+                "Keeping current offset.")
+        else:
+            print(f"\ncontroller: Using calibration from {route['updated']}")
+        self.sessionpars['slm_offset'].set(self.calmodel.get_offset())
+        self._save_sessionpars()
+
+
     def _show_calibration_dialog(self):
         """ Display the calibration dialog window.
         """
@@ -437,6 +612,73 @@ class Application(tk.Tk):
             # )
 
 
+    def _tune_device(self):
+        """ Find the lowest stable blocksize/latency for the current
+            audio device. Runs in the background (several seconds
+            per setting).
+        """
+        if self._tuner is not None:
+            messagebox.showinfo(
+                title="Tuning In Progress",
+                message="The audio device is already being tuned.",
+                detail="Please wait for the current run to finish."
+            )
+            return
+
+        device_id = self.sessionpars['audio_device'].get()
+        # Tune at the current stimulus' sampling rate, if there is one
+        try:
+            fs = self.a.fs
+        except AttributeError:
+            fs = None
+        try:
+            tuner = tunermodel.StreamTuner(device_id, fs=fs)
+        except (sd.PortAudioError, ValueError) as e:
+            print(f"controller: {e}")
+            audiomodel.Audio._invalid_device()
+            return
+        print(f"\ncontroller: Tuning audio device {device_id} at " +
+            f"{tuner.fs} Hz, {tuner.channels} channel(s)...")
+        self._tuner = tuner
+        self._tuner.sweep_async(self, self._on_tune_done)
+
+
+    def _on_tune_done(self, best, error):
+        """ Store the tuning result in the device's profile
+        """
+        tuner, self._tuner = self._tuner, None
+        if error is not None:
+            messagebox.showerror(
+                title="Tuning Failed",
+                message="Could not tune the audio device!",
+                detail=f"{error}"
+            )
+            return
+        if best is None:
+            messagebox.showwarning(
+                title="No Stable Setting",
+                message="No blocksize/latency ran without underflows.",
+                detail="The device keeps its default settings."
+            )
+            return
+        try:
+            tuner.save(self.calmodel.profiles, best)
+        except LookupError as e:
+            print(f"controller: {e}")
+            messagebox.showerror(
+                title="Invalid Audio Device",
+                message="Cannot store the tuning result!",
+                detail=f"{e}"
+            )
+            return
+        messagebox.showinfo(
+            title="Tuning Complete",
+            message=f"Blocksize: {best['blocksize']}, latency: " +
+                f"{best['latency']}",
+            detail=f"Output latency: {best['output_latency'] * 1000:.1f} ms"
+        )
+
+
     ################################
     # Calibration Dialog Functions #
     ################################
@@ -444,7 +686,16 @@ class Application(tk.Tk):
         """ Load calibration file and present.
         """
         # Get calibration file
-        self.calmodel._get_cal_file()
+        try:
+            self.calmodel._get_cal_file()
+        except FileNotFoundError as e:
+            print(e)
+            messagebox.showerror(
+                title="File Not Found",
+                message="Cannot find calibration file!",
+                detail=f"{e}"
+            )
+            return
 
         # Play calibration file
         self.calmodel.play_cal()
@@ -461,7 +712,17 @@ class Application(tk.Tk):
         """ Calculate offset based on SLM reading.
         """
         # Calculate new presentation level
-        self.calmodel._calc_offset()
+        try:
+            self.calmodel._calc_offset()
+        except LookupError as e:
+            print(f"controller: {e}")
+            messagebox.showerror(
+                title="Invalid Audio Device",
+                message="Cannot store the calibration!",
+                detail=f"{e}\nCheck the audio device and repeat " +
+                    "the reading."
+            )
+            return
         # Save level - this must be called here!
         self._save_sessionpars()
 
@@ -482,28 +743,145 @@ class Application(tk.Tk):
         """
         print("controller: Looking for help file in compiled " +
             "version temp location...")
-        help_file = functions.resource_path('README\\README.html')
-        #help_file = self.resource_path('README\\README.html')
-        file_exists = os.access(help_file, os.F_OK)
-        if not file_exists:
+        if assets.frozen():
+            try:
+                help_file = assets.find(os.path.join('README', 'README.html'))
+            except FileNotFoundError as e:
+                self._open_help(None, e)
+                return
+            webbrowser.open(help_file)
+        else:
             print('controller: Not found!\nChecking for help file in ' +
                 'local script version location')
-            # Read markdown file and convert to html
-            with open('README.md', 'r') as f:
-                text = f.read()
-                html = markdown.markdown(text)
+            # Render README.md off the Tk thread (only if it changed)
+            # and open it in default web browser when ready
+            self.helpmodel.render_async(self, self._open_help)
 
-            # Create html file for display
-            with open('.\\assets\\README\\README.html', 'w') as f:
-                f.write(html)
 
-            # Open README in default web browser
-            webbrowser.open('.\\assets\\README\\README.html')
-        else:
-            #help_file = self.resource_path('README\\README.html')
-            webbrowser.open(help_file)
+    def _open_help(self, path, error):
+        """ Open rendered help file in default web browser
+        """
+        if error is not None:
+            print(f"controller: Help file unavailable: {error}")
+            messagebox.showerror(
+                title="Help Not Found",
+                message="Cannot display help file!",
+                detail=f"{error}"
+            )
+            return
+        webbrowser.open(str(path.resolve()))
 
 
-if __name__ == "__main__":
-    app = Application()
+def station_name(value):
+    """ Station names end up in file names: keep them plain.
+    """
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', value):
+        raise argparse.ArgumentTypeError(
+            f"'{value}': use letters, digits, '-' or '_'")
+    return value
+
+
+def simulate(app, driver):
+    """ Run the simulated session, then quit. Quits even if a 
+        trial raises, so the engine, stores and memory report 
+        are still closed and mainloop returns.
+    """
+    try:
+        driver.run()
+    finally:
+        app._quit()
+
+
+def run(args, station=None):
+    """ Configure the audio models and run one Application.
+        Called once per station in multi-station mode.
+    """
+    if args.audio_engine:
+        # Real-time measures are applied where streams are opened
+        audiomodel.Audio.engine = enginemodel.AudioEngine(
+            realtime=args.realtime)
+        audiomodel.Audio.engine.start()
+    elif args.realtime:
+        audiomodel.Audio.realtime = realtimemodel.RealtimeMode()
+    if args.stations:
+        audiomodel.Audio.store = stationmodel.StimulusStore()
+
+    app = Application(check_updates=not args.simulate,
+        memprofile=args.memprofile, station=station)
+
+    if args.simulate:
+        driver = simmodel.SimulationDriver(
+            app,
+            simmodel.VirtualListener(seed=args.seed),
+            trials=args.simulate,
+            workdir=args.workdir or tempfile.mkdtemp(),
+            report=args.sim_report
+        )
+        random.seed(args.seed)
+        app.after(100, simulate, app, driver)
+
     app.mainloop()
+
+
+def run_stations(args):
+    """ Run one Application process per station. Stimuli named
+        in the stations' settings are decoded once up front and
+        shared with every station.
+    """
+    # Stations attach each other's blocks: one tracker for all
+    enginemodel.share_resource_tracker()
+    store = stationmodel.StimulusStore()
+    store.preload({
+        sessionmodel.SessionParsModel(station).fields[
+            'stim_file_path']['value']
+        for station in args.stations
+    })
+
+    processes = [
+        multiprocessing.Process(target=run, args=(args, station),
+            name=f"station-{station}")
+        for station in args.stations
+    ]
+    for process in processes:
+        process.start()
+        print(f"controller: Station {process.name[8:]} started " +
+            f"(pid {process.pid})")
+    for process in processes:
+        process.join()
+    store.close()
+
+
+if __name__ == "__main__":
+    # Needed for child processes in compiled builds
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="MOA Task Controller (OTF)")
+    parser.add_argument('--simulate', type=int, metavar='TRIALS',
+        help="run TRIALS trials with a virtual listener and no audio")
+    parser.add_argument('--seed', type=int, default=None,
+        help="random seed for the virtual listener")
+    parser.add_argument('--workdir', default=None,
+        help="folder for simulation settings and data (default: temp)")
+    parser.add_argument('--sim-report', default=None,
+        help="csv file for simulation memory/handle samples")
+    parser.add_argument('--memprofile', nargs='?', metavar='REPORT',
+        const='memprofile_report.txt', default=None,
+        help="trace allocations per trial and write REPORT at quit")
+    parser.add_argument('--realtime', action='store_true',
+        help="hold off GC, lock buffers and raise audio thread " +
+            "priority for each presentation (Linux); with " +
+            "--audio-engine, in the engine process")
+    parser.add_argument('--audio-engine', action='store_true',
+        help="play audio from a separate process")
+    stations = parser.add_mutually_exclusive_group()
+    stations.add_argument('--station', type=station_name, default=None,
+        help="use the settings file and data folder of one station")
+    stations.add_argument('--stations', type=station_name, nargs='+',
+        metavar='STATION', default=None,
+        help="run one window per station, sharing decoded stimuli")
+    args = parser.parse_args()
+
+    if args.stations:
+        run_stations(args)
+    else:
+        run(args, args.station)
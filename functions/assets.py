@@ -0,0 +1,83 @@
+""" Registry for bundled assets (images, audio, help files).
+
+    Asset locations are resolved once per process: the PyInstaller
+    temp folder (_MEIPASS) when running the compiled app, then the
+    local assets directory. Images are decoded once and shared by
+    every widget that uses them.
+"""
+
+###########
+# Imports #
+###########
+# Import GUI packages
+import tkinter as tk
+
+# Import system packages
+import sys
+import os
+import weakref
+
+
+#########
+# Funcs #
+#########
+_roots = None
+
+# Decoded images for each Tk root: {relative_path: PhotoImage}.
+# Images belong to one Tk interpreter, so each root has its own
+# cache; it goes away with the root.
+_images = weakref.WeakKeyDictionary()
+
+
+def frozen():
+    """ True when running from a PyInstaller build
+    """
+    return hasattr(sys, '_MEIPASS')
+
+
+def base_path():
+    """ Base directory for compiled resources
+    """
+    if frozen():
+        return sys._MEIPASS
+    return os.path.abspath(".")
+
+
+def roots():
+    """ Directories searched for assets, in order.
+        Resolved on first use.
+    """
+    global _roots
+    if _roots is None:
+        _roots = []
+        if frozen():
+            _roots.append(sys._MEIPASS)
+        _roots.append(os.path.abspath("assets"))
+    return _roots
+
+
+def find(relative_path):
+    """ Return the absolute path to an asset, or raise
+        FileNotFoundError if it is not in any asset location
+    """
+    for root in roots():
+        path = os.path.join(root, relative_path)
+        if os.access(path, os.F_OK):
+            return path
+    raise FileNotFoundError(
+        f"assets: Cannot find '{relative_path}' in {roots()}")
+
+
+def image(relative_path, master):
+    """ Return a shared PhotoImage for an image asset, for use
+        in master's window. Each image is decoded once per Tk 
+        root.
+    """
+    root = master._root()
+    cache = _images.setdefault(root, {})
+    try:
+        return cache[relative_path]
+    except KeyError:
+        img = tk.PhotoImage(master=root, file=find(relative_path))
+        cache[relative_path] = img
+        return img
@@ -5,9 +5,11 @@
 # Imports #
 ###########
 # Import system packages
-import sys
 import os
 
+# Import custom modules
+from functions import assets
+
 
 #########
 # Funcs #
@@ -15,13 +17,9 @@ import os
 def resource_path(relative_path):
     """ Create the absolute path to compiled resources
     """
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
+    # PyInstaller creates a temp folder and stores path in _MEIPASS
+    # The base path is resolved by the asset registry
+    return os.path.join(assets.base_path(), relative_path)
 
 
 def truncate_path(long_path):
@@ -0,0 +1,48 @@
+""" Helpers for running models without a Tk display.
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import copy
+
+# Import custom modules
+from models import sessionmodel
+
+
+#########
+# Funcs #
+#########
+class Var:
+    """ Stand-in for tk variables when there is no Tk root.
+        Values are cast to the variable type on set(), like 
+        tk.IntVar and friends.
+    """
+    _casts = {'bool': bool, 'str': str, 'int': int, 'float': float}
+
+    def __init__(self, value=None, vartype='str'):
+        self._cast = self._casts.get(vartype, str)
+        self.set(value)
+
+
+    def get(self):
+        return self._value
+
+
+    def set(self, value):
+        self._value = self._cast(value)
+
+
+def make_sessionpars(**overrides):
+    """ Create a sessionpars dict of Vars holding the model 
+        defaults (the user's settings file is not read).
+    """
+    fields = copy.deepcopy(sessionmodel.SessionParsModel.fields)
+    sessionpars = {
+        key: Var(data['value'], data['type']) 
+        for key, data in fields.items()
+    }
+    for key, value in overrides.items():
+        sessionpars[key].set(value)
+    return sessionpars
@@ -0,0 +1,67 @@
+""" sounddevice, or a stand-in when the PortAudio library is
+    missing.
+
+    Offline tools (the batch exporter, scripted calibration runs)
+    import the audio models but never open a device, so they must
+    run on machines without PortAudio. Import sd from here instead
+    of importing sounddevice directly:
+
+        from functions.portaudio import sd
+
+    Without PortAudio, available is False and anything that would
+    reach a device raises sd.PortAudioError, which the audio models
+    already report as an invalid device.
+
+    Written by: Travis M. Moore
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import types
+
+
+#########
+# Funcs #
+#########
+def _stand_in(reason):
+    """ Module with the parts of sounddevice the app uses. The
+        device list is empty and device calls raise PortAudioError,
+        as they would with no devices.
+    """
+    stand_in = types.ModuleType('sounddevice')
+
+    class PortAudioError(Exception):
+        pass
+
+    class CallbackStop(Exception):
+        pass
+
+    def unavailable(*args, **kwargs):
+        raise PortAudioError(f"PortAudio not available: {reason}")
+
+    def query_devices(device=None, kind=None):
+        # The device list is empty; any single device is invalid
+        if device is None and kind is None:
+            return []
+        unavailable()
+
+    stand_in.PortAudioError = PortAudioError
+    stand_in.CallbackStop = CallbackStop
+    stand_in.default = types.SimpleNamespace(
+        device=[None, None], samplerate=None)
+    stand_in.query_devices = query_devices
+    stand_in.play = unavailable
+    stand_in.stop = lambda *args, **kwargs: None
+    stand_in.OutputStream = unavailable
+    return stand_in
+
+
+try:
+    import sounddevice as sd
+    available = True
+except OSError as e:
+    print(f"portaudio: {e}; audio playback is disabled")
+    sd = _stand_in(e)
+    available = False
@@ -64,6 +64,10 @@ class MainMenu(tk.Menu):
             label='Calibration...',
             command=self._event('<<ToolsCalibration>>')
         )
+        tools_menu.add_command(
+            label='Tune Audio Device...',
+            command=self._event('<<ToolsTuneDevice>>')
+        )
         # Add Tools menu to the menubar
         self.add_cascade(label="Tools", menu=tools_menu)
 
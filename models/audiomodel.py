@@ -10,14 +10,19 @@ import matplotlib.pyplot as plt
 
 # Import system packages
 import os
+import threading
+from contextlib import nullcontext
 
 # Import audio packages
 import soundfile as sf
-import sounddevice as sd
+from functions.portaudio import sd
 
 # Import GUI packages
 from tkinter import messagebox
 
+# Import custom modules
+from models import ringbuffermodel
+
 
 #########
 # BEGIN #
@@ -25,6 +30,31 @@ from tkinter import messagebox
 class Audio:
     """ Class for use with .wav files.
     """
+    # Optional callable sink(buffer, fs, device_id, speaker) that 
+    # receives buffers instead of the sound card (headless runs)
+    sink = None
+
+    # Optional realtimemodel.RealtimeMode applied around each 
+    # presentation
+    realtime = None
+
+    # Optional enginemodel.AudioEngine that plays buffers in a 
+    # separate process
+    engine = None
+
+    # Optional stationmodel.StimulusStore: files are decoded once
+    # and shared read-only between station processes
+    store = None
+
+    # Optional profilemodel.DeviceProfileModel: tuned blocksize and
+    # latency are used for each device
+    profiles = None
+
+    # Optional marker (trigger) signal, same length as signal, and 
+    # the output channel (1-based) it is played on. It is never 
+    # scaled by the presentation level.
+    marker = None
+    marker_channel = None
 
     def __init__(self, file_path):
         """ Read audio file and generate info.
@@ -44,12 +74,49 @@ class Audio:
             raise FileNotFoundError
         else:
             try:
-                self.signal, self.fs = sf.read(self.file_path)
+                self.signal, self.fs = self._read(self.file_path)
                 print("audiomodel: Found!")
                 print(f"audiomodel: Sampling rate: {self.fs}")
             except sf.LibsndfileError:
                 raise FileNotFoundError
 
+        self._describe()
+
+
+    @classmethod
+    def _read(cls, file_path):
+        """ Decode a file, from the shared store when there is one.
+        """
+        if cls.store is not None:
+            try:
+                return cls.store.load(file_path)
+            except OSError as e:
+                # Includes TimeoutError: another station never
+                # finished decoding. Use a private copy instead.
+                print(f"audiomodel: Shared copy unavailable ({e}); " +
+                    "reading from disk")
+        return sf.read(file_path)
+
+
+    @classmethod
+    def from_array(cls, signal, fs, name='synthesized.wav'):
+        """ Audio object for a signal made in memory (no file).
+            signal: 1-D or 2-D (frames, channels) array
+        """
+        print(f"\naudiomodel: Using synthesized {name}")
+        audio = cls.__new__(cls)
+        audio.directory = ''
+        audio.name = name
+        audio.file_path = None
+        audio.signal = signal
+        audio.fs = fs
+        audio._describe()
+        return audio
+
+
+    def _describe(self):
+        """ Generate info from the signal.
+        """
         # Get number of channels
         try:
             self.num_channels = self.signal.shape[1]
@@ -69,34 +136,40 @@ class Audio:
         print(f"audiomodel: Data type: {self.data_type}")
 
 
-    def play(self, level=None, device_id=None, speaker=None):
+    def play(self, level=None, device_id=None, speaker=None,
+             preroll=None):
         """ Present audio
+            preroll: first sample reaches the DAC this many 
+                seconds after the stream opens (default: as soon
+                as possible). See Presentation.
         """
         print("\naudiomodel: Preparing to present audio...")
+        # The engine applies the level itself, so the signal is 
+        # shared once and not scaled here
+        if self.engine is not None and self.sink is None \
+                and level is not None and self.marker is None:
+            return self._engine_play(level, device_id, speaker,
+                preroll=preroll)
+
         # Create a temporary signal to be modified
-        temp = self.signal.copy()
-        temp = temp.astype(np.float32)
+        temp = self.prepare(level)
 
-        # Assign audio device defaults
-        sd.default.device = device_id
-        sd.default.samplerate = self.fs
+        # Add the marker channel after scaling
+        if self.marker is not None:
+            temp, speaker = self.add_marker(temp, speaker)
 
-        # Get number of available audio device channels
-        try:
-            self.num_outputs = sd.query_devices(sd.default.device)['max_output_channels']
-        except sd.PortAudioError:
-            messagebox.showerror(
-                title="Invalid Audio Device",
-                message="Invalid audio device!",
-                detail="Please provide a valid audio device " +
-                "id before continuing."
-            )
-            return
+        # Present audio
+        return self.play_buffer(temp, device_id=device_id, speaker=speaker,
+            preroll=preroll)
 
-        # Display audio device features to console
-        print(f"audiomodel: Audio device: " + 
-              f"{sd.query_devices(sd.default.device)['name']}")
-        print(f"audiomodel: Device outputs: {self.num_outputs}")
+
+    def prepare(self, level=None):
+        """ Return a float32 copy of the signal scaled to 
+            level (dB). Normalizes if no level is provided.
+        """
+        # Create a temporary signal to be modified
+        temp = self.signal.copy()
+        temp = temp.astype(np.float32)
 
         # Set presentation level
         if level == None:
@@ -114,42 +187,206 @@ class Audio:
         else:
             # Convert level in dB to magnitude
             mag = self.db2mag(level)
-            # Apply scaling factor to temp
-            temp = temp * mag
-
-        print(f"audiomodel: Audio shape: {temp.shape}")
-        print(f"audiomodel: Routing to speaker {speaker}")
+            # Apply scaling factor to temp (in place: stays float32)
+            temp *= mag
 
         # Check for clipping after level has been applied
         if np.max(np.abs(temp)) > 0.999:
             self._clipping(temp)
 
+        return temp
+
+
+    def add_marker(self, temp, speaker):
+        """ Combine a scaled (mono) signal with the marker into 
+            one buffer that spans the speaker and marker channels.
+            Returns the buffer and the first channel to route it 
+            to (for the usual speaker mapping).
+        """
+        speaker = speaker or 1
+        sig = temp.reshape(len(temp), -1)[:, 0]
+        first = min(speaker, self.marker_channel)
+        width = abs(self.marker_channel - speaker) + 1
+
+        buffer = np.zeros((len(sig), width), dtype=np.float32)
+        buffer[:, speaker - first] = sig
+        buffer[:, self.marker_channel - first] = \
+            self.marker[:len(sig)]
+        print(f"audiomodel: Marker on channel {self.marker_channel}")
+        return buffer, first
+
+
+    def _engine_play(self, level, device_id, speaker, preroll=None):
+        """ Present the signal at level through the engine.
+        """
+        try:
+            key = self.engine.attach(self.signal, self.fs)
+            mag = self.db2mag(level)
+            # Check for clipping after level has been applied
+            if self.engine.peak(key) * mag > 0.999:
+                self._clipping(self.signal * mag)
+            print(f"audiomodel: Routing to speaker {speaker} (audio engine)")
+            return self.engine.play(key, device_id, speaker, gain=mag,
+                preroll=preroll,
+                **self.stream_settings(device_id, self.fs,
+                    self._outputs(self.signal, speaker)))
+        except sd.PortAudioError:
+            self._invalid_device()
+        except (RuntimeError, TimeoutError) as e:
+            self._engine_failed(e)
+
+
+    def play_buffer(self, temp, device_id=None, speaker=None,
+                    preroll=None):
+        """ Present an already scaled buffer (see prepare).
+            Returns the Presentation (or the engine's 
+            EnginePresentation) for its stream status counts and 
+            onset, Untracked when a sink played it, or None when 
+            nothing was played.
+        """
+        # Hand buffer to sink instead of the sound card
+        if self.sink is not None:
+            self.sink(temp, self.fs, device_id, speaker)
+            return Untracked()
+
+        # Hand buffer to the engine process
+        if self.engine is not None:
+            try:
+                key = self.engine.attach(temp, self.fs)
+                return self.engine.play(key, device_id, speaker,
+                    preroll=preroll,
+                    **self.stream_settings(device_id, self.fs,
+                        self._outputs(temp, speaker)))
+            except sd.PortAudioError:
+                self._invalid_device()
+            except (RuntimeError, TimeoutError) as e:
+                self._engine_failed(e)
+            return
+
+        # Assign audio device defaults
+        sd.default.device = device_id
+        sd.default.samplerate = self.fs
+
+        # Get number of available audio device channels
+        try:
+            self.num_outputs = sd.query_devices(sd.default.device)['max_output_channels']
+        except sd.PortAudioError:
+            self._invalid_device()
+            return
+
+        # Display audio device features to console
+        print(f"audiomodel: Audio device: " + 
+              f"{sd.query_devices(sd.default.device)['name']}")
+        print(f"audiomodel: Device outputs: {self.num_outputs}")
+
+        print(f"audiomodel: Audio shape: {temp.shape}")
+        print(f"audiomodel: Routing to speaker {speaker}")
+
         # Present audio
         print("audiomodel: Attempting to present audio...")
-        # Check that audio device has enough channels for audio
-        if self.num_outputs < self.num_channels:
-            print(f"\naudiomodel: {self.num_channels}-channel file, but "
-                f"only {self.num_outputs} audio device output channels!")
-            print("audiomodel: Dropping " +
-                f"{self.num_channels - self.num_outputs} audio file channels")
-            try:
-                sd.play(temp[:, 0:self.num_outputs])
-                #sd.wait(self.dur+0.5)
-            except Exception as e:
-                print(e)
-            print("audiomodel: Done")
-        else:
-            try:
-                sd.play(temp.T, mapping=speaker)
-                #sd.wait(self.dur+0.5)
-            except Exception as e:
-                print(e)
+        presentation = nullcontext() if self.realtime is None \
+            else self.realtime.presentation(temp)
+        with presentation:
+            # Check that audio device has enough channels for audio
+            if self.num_outputs < self.num_channels:
+                print(f"\naudiomodel: {self.num_channels}-channel file, but "
+                    f"only {self.num_outputs} audio device output channels!")
+                print("audiomodel: Dropping " +
+                    f"{self.num_channels - self.num_outputs} audio file channels")
+                player = Presentation(temp[:, 0:self.num_outputs], self.fs,
+                    device_id, preroll=preroll,
+                    **self.stream_settings(device_id, self.fs,
+                        self.num_outputs))
+            else:
+                player = Presentation(temp, self.fs, device_id, speaker,
+                    preroll=preroll,
+                    **self.stream_settings(device_id, self.fs,
+                        self._outputs(temp, speaker)))
+            player.start()
             print("audiomodel: Done")
+        return player
+
+
+    @staticmethod
+    def _outputs(buffer, speaker):
+        """ Output channels a stream needs for buffer routed to 
+            speaker (before dropping channels the device lacks)
+        """
+        channels = 1 if buffer.ndim == 1 else buffer.shape[1]
+        return channels if speaker is None else speaker - 1 + channels
+
+
+    @staticmethod
+    def _invalid_device():
+        messagebox.showerror(
+            title="Invalid Audio Device",
+            message="Invalid audio device!",
+            detail="Please provide a valid audio device " +
+            "id before continuing."
+        )
+
+
+    @classmethod
+    def _engine_failed(cls, error):
+        """ The engine process died or stopped answering. Start a 
+            new one; if that fails too, play in this process.
+        """
+        print(f"audiomodel: {error}")
+        try:
+            cls.engine.restart()
+            detail = "The audio engine has been restarted."
+        except Exception as e:
+            print(f"audiomodel: Cannot restart audio engine: {e}")
+            cls.engine = None
+            detail = "Audio is now played without the engine."
+        messagebox.showerror(
+            title="Audio Engine Error",
+            message="The audio engine stopped responding!",
+            detail=f"{error}\n{detail} Please repeat the presentation."
+        )
+
+
+    @classmethod
+    def stream_settings(cls, device_id, fs=None, channels=None):
+        """ Tuned blocksize/latency for a device. Empty if the 
+            device was never tuned, or was tuned at another 
+            sampling rate or with fewer channels than the stream
+            will use: a setting that ran clean there may underflow
+            here.
+        """
+        if cls.profiles is None:
+            return {}
+        settings = cls.profiles.get_stream_settings(device_id)
+        if not settings:
+            return {}
+        # Profiles from before channels were recorded were tuned 
+        # with one channel
+        tuned_fs = settings.get('fs')
+        tuned_channels = settings.get('channels', 1)
+        if (fs is not None and tuned_fs is not None and fs != tuned_fs) \
+                or (channels is not None and channels > tuned_channels):
+            print(f"audiomodel: Device was tuned at {tuned_fs} Hz, "
+                f"{tuned_channels} channel(s); using default stream "
+                "settings")
+            return {}
+        return {
+            'blocksize': settings['blocksize'],
+            'latency': settings['latency'],
+        }
 
 
     def stop(self):
         """ Stop audio presentation.
         """
+        if self.sink is not None:
+            return
+        if self.engine is not None:
+            try:
+                self.engine.stop()
+            except (RuntimeError, TimeoutError) as e:
+                self._engine_failed(e)
+            return
+        Presentation.stop_current()
         sd.stop()
 
 
@@ -166,13 +403,15 @@ class Audio:
 
 
     def _clipping(self, temp):
-        messagebox.showerror(
-            title="Clipping",
-            message="The level provided is too high. Enter a lower level.",
-            detail="The waveform will be plotted when this message is " +
-                "closed for visual inspection."
-        )
-        self.plot_wave(temp)
+        # No one to show the plot to when audio goes to a sink
+        if self.sink is None:
+            messagebox.showerror(
+                title="Clipping",
+                message="The level provided is too high. Enter a lower level.",
+                detail="The waveform will be plotted when this message is " +
+                    "closed for visual inspection."
+            )
+            self.plot_wave(temp)
         raise Exception("audiomodel: Clipping occurred")
 
 
@@ -188,35 +427,43 @@ class Audio:
 
 
     @staticmethod
-    def db2mag(db):
+    def _as_float(x):
+        """ x as a float array, keeping float32/float64 dtype
+        """
+        x = np.asarray(x)
+        if x.dtype.kind != 'f':
+            x = x.astype(np.float64)
+        return x
+
+
+    @classmethod
+    def db2mag(cls, db):
         """ 
             Convert decibels to magnitude. Takes a single
-            value or a list of values.
+            value, a list of values or an array. Returns a 
+            scalar for a single value, otherwise an array of 
+            the same float dtype.
         """
-        # Must use this form to handle negative db values!
-        try:
-            mag = [10**(x/20) for x in db]
-            return mag
-        except:
-            mag = 10**(db/20)
-            return mag
+        db = cls._as_float(db)
+        mag = np.power(db.dtype.type(10), db / 20)
+        return mag[()]
 
 
-    @staticmethod
-    def mag2db(mag):
+    @classmethod
+    def mag2db(cls, mag):
         """ 
             Convert magnitude to decibels. Takes a single
-            value or a list of values.
+            value, a list of values or an array. Returns a 
+            scalar for a single value, otherwise an array of 
+            the same float dtype.
         """
-        try:
-            db = [20 * np.log10(x) for x in mag]
-            return db
-        except:
-            db = 20 * np.log10(mag)
-            return db
+        mag = cls._as_float(mag)
+        db = 20 * np.log10(mag)
+        return db[()]
 
 
-    def rms(self, sig):
+    @staticmethod
+    def rms(sig):
         """ 
             Calculate the root mean square of a signal. 
             
@@ -235,6 +482,8 @@ class Audio:
     def setRMS(self, sig, amp, eq='n'):
         """
             Set RMS level of a 1-channel or 2-channel signal.
+            Channels are along the first axis. See set_rms for 
+            signals with any number of channels.
         
             SIG: a 1-channel or 2-channel signal
             AMP: the desired amplitude to be applied to 
@@ -255,61 +504,430 @@ class Audio:
             Written by: Travis M. Moore
             Created: Jan. 10, 2022
             Last edited: May 17, 2022
+            Now calls set_rms (same levels, any channel count)
         """
-        if len(sig.shape) == 1:
-            rmsdb = self.mag2db(self.rms(sig))
-            refdb = amp
-            diffdb = np.abs(rmsdb - refdb)
-            if rmsdb > refdb:
-                sigAdj = sig / self.db2mag(diffdb)
-            elif rmsdb < refdb:
-                sigAdj = sig * self.db2mag(diffdb)
-            # Edit 5/17/22
-            # Added handling for when rmsdb == refdb
-            elif rmsdb == refdb:
-                sigAdj = sig
-            return sigAdj
-            
-        elif len(sig.shape) == 2:
-            rmsdbLeft = self.mag2db(self.rms(sig[0]))
-            rmsdbRight = self.mag2db(self.rms(sig[1]))
-
-            ILD = np.abs(rmsdbLeft - rmsdbRight) # get lvl diff
-
-            # Determine lvl advantage
-            if rmsdbLeft > rmsdbRight:
-                lvlAdv = 'left'
-                #print("Adv: %s" % lvlAdv)
-            elif rmsdbRight > rmsdbLeft:
-                lvlAdv = 'right'
-                #print("Adv: %s" % lvlAdv)
-            elif rmsdbLeft == rmsdbRight:
-                lvlAdv = None
-
-            #refdb = amp - 3 # apply half amp to each channel
-            refdb = amp
-            diffdbLeft = np.abs(rmsdbLeft - refdb)
-            diffdbRight = np.abs(rmsdbRight - refdb)
-
-            # Adjust left channel
-            if rmsdbLeft > refdb:
-                sigAdjLeft = sig[0] / self.db2mag(diffdbLeft)
-            elif rmsdbLeft < refdb:
-                sigAdjLeft = sig[0] * self.db2mag(diffdbLeft)
-            # Adjust right channel
-            if rmsdbRight > refdb:
-                sigAdjRight = sig[1] / self.db2mag(diffdbRight)
-            elif rmsdbRight < refdb:
-                sigAdjRight = sig[1] * self.db2mag(diffdbRight)
-
-            # If there is a lvl difference to maintain across channels
-            if eq == 'n':
-                if lvlAdv == 'left':
-                    sigAdjLeft = sigAdjLeft * self.db2mag(ILD/2)
-                    sigAdjRight = sigAdjRight / self.db2mag(ILD/2)
-                elif lvlAdv == 'right':
-                    sigAdjLeft = sigAdjLeft / self.db2mag(ILD/2)
-                    sigAdjRight = sigAdjRight * self.db2mag(ILD/2)
-
-            sigBothAdj = np.array([sigAdjLeft, sigAdjRight])
-            return sigBothAdj
+        return self.set_rms(sig, amp, axis=-1, preserve_ild=(eq == 'n'))
+
+
+    @staticmethod
+    def channel_rms(sig, axis=-1, block=65536):
+        """ RMS of each channel, where axis is the time axis. 
+            Sums of squares are accumulated in float64 without 
+            making a squared copy of the signal; other dtypes are
+            converted block samples at a time.
+        """
+        sig = np.moveaxis(np.asarray(sig), axis, 0)
+        if sig.dtype == np.float64:
+            sumsq = np.einsum('i...,i...->...', sig, sig)
+        else:
+            sumsq = np.zeros(sig.shape[1:])
+            for start in range(0, len(sig), block):
+                chunk = sig[start:start+block].astype(np.float64)
+                sumsq += np.einsum('i...,i...->...', chunk, chunk)
+        return np.sqrt(sumsq / len(sig))
+
+
+    @classmethod
+    def set_rms(cls, sig, amp, axis=-1, preserve_ild=True, out=None):
+        """ Set the RMS level (dB) of every channel of sig.
+
+            axis: the time axis (use axis=0 for (frames, channels)
+                signals, as read from .wav files)
+            preserve_ild: apply one gain to all channels so their 
+                mean level is amp and level differences between 
+                channels are kept. Otherwise each channel is set 
+                to amp.
+            out: array to write into (may be sig itself). By 
+                default a new array is returned, float32 for 
+                float32 input and float64 otherwise.
+
+            Silent channels are left as they are.
+        """
+        sig = np.asarray(sig)
+        if out is None:
+            out = np.empty(sig.shape, np.result_type(sig.dtype, np.float32))
+
+        with np.errstate(divide='ignore'):
+            rmsdb = cls.mag2db(cls.channel_rms(sig, axis))
+        audible = np.isfinite(rmsdb)
+        if preserve_ild:
+            gaindb = amp - rmsdb[audible].mean() if audible.any() else 0.0
+            gaindb = np.where(audible, gaindb, 0.0)
+        else:
+            gaindb = np.where(audible, amp - rmsdb, 0.0)
+
+        gain = np.asarray(cls.db2mag(gaindb), dtype=out.dtype)
+        if np.all(gain == gain.flat[0]):
+            # Same gain everywhere: a scalar multiply is much
+            # faster than broadcasting over interleaved channels
+            np.multiply(sig, gain.flat[0], out=out)
+        else:
+            # One gain per channel, broadcast along the time axis
+            np.multiply(sig, np.expand_dims(gain, axis), out=out)
+        return out
+
+
+class Presentation:
+    """ Play a buffer once from a stream callback and count the 
+        stream status flags seen while it plays: output 
+        underflows, priming callbacks and late callbacks (called 
+        after their buffer was due at the DAC).
+
+        The onset can be scheduled with a preroll: once the 
+        stream is open, the onset is set to preroll seconds later
+        on the stream clock (start_time), and the callback pads 
+        with silence up to the sample that reaches the DAC then.
+        Onset jitter is set by the device rather than by when 
+        Python opened the stream. The DAC time of the first 
+        sample is recorded.
+    """
+    # Only one presentation plays at a time (as with sd.play)
+    _current = None
+    _current_lock = threading.Lock()
+
+    def __init__(self, buffer, fs, device_id=None, speaker=None,
+                 blocksize=0, latency=None, preroll=None):
+        """ buffer: 1-D or 2-D (frames, channels) signal
+            speaker: first output channel (1-based) to route to
+            blocksize, latency: stream settings (PortAudio 
+                defaults unless tuned)
+            preroll: onset this many seconds after the stream 
+                opens. Must cover the output latency, or the 
+                onset is late.
+        """
+        self.fs = fs
+        self.device_id = device_id
+        self.blocksize = blocksize
+        self.latency = latency
+        self.stream = None
+        self._lock = threading.Lock()
+
+        # Onset scheduling (stream clock, s; set by start())
+        self.start_time = None
+        self.preroll = preroll
+        self.onset_time = None
+
+        # Route channels, starting at speaker
+        sig = np.asarray(buffer).reshape(len(buffer), -1)
+        self._first = 0 if speaker is None else speaker - 1
+        self.num_outputs = self._first + sig.shape[1]
+        self._data = sig.astype(np.float32, copy=False)
+        self._pos = 0
+
+        # Status counts
+        self.callbacks = 0
+        self.underflows = 0
+        self.priming = 0
+        self.late = 0
+        self.errors = 0
+
+
+    def _callback(self, outdata, frames, time, status):
+        """ Copy the next block and record the stream status. 
+            Runs on the audio thread.
+        """
+        self.callbacks += 1
+        if status.output_underflow:
+            self.underflows += 1
+        if status.priming_output:
+            self.priming += 1
+        # Hosts that do not report times give zeros
+        if time.outputBufferDacTime and \
+                time.currentTime > time.outputBufferDacTime:
+            self.late += 1
+
+        outdata.fill(0)
+        offset = 0
+        if self._pos == 0 and self.onset_time is None:
+            offset = self._onset_offset(time.outputBufferDacTime, frames)
+            if offset >= frames:
+                # Not due yet: silence
+                return
+
+        chunk = self._data[self._pos:self._pos + frames - offset]
+        n = len(chunk)
+        outdata[offset:offset + n, self._first:] = chunk
+        self._pos += n
+        if offset + n < frames:
+            raise sd.CallbackStop
+
+
+    def _onset_offset(self, dac_time, frames):
+        """ Frames of silence before the onset in the buffer that 
+            reaches the DAC at dac_time. Records the onset time
+            once the onset falls in this buffer.
+        """
+        # Hosts that do not report times cannot be scheduled
+        if not dac_time:
+            self.onset_time = 0.0
+            return 0
+        offset = 0
+        if self.start_time is not None:
+            offset = max(0, round((self.start_time - dac_time) * self.fs))
+            if offset >= frames:
+                return offset
+        self.onset_time = dac_time + offset / self.fs
+        return offset
+
+
+    def start(self):
+        """ Stop whatever is playing and start this buffer
+        """
+        Presentation.stop_current()
+        try:
+            self.stream = sd.OutputStream(
+                samplerate=self.fs,
+                device=self.device_id,
+                channels=self.num_outputs,
+                dtype='float32',
+                blocksize=self.blocksize,
+                latency=self.latency,
+                callback=self._callback,
+                finished_callback=self._on_finished
+            )
+            # The stream clock runs once the stream is open
+            if self.preroll:
+                self.start_time = self.stream.time + self.preroll
+            self.stream.start()
+        except (sd.PortAudioError, ValueError) as e:
+            print(f"audiomodel: {e}")
+            self.errors += 1
+            return
+        with Presentation._current_lock:
+            Presentation._current = self
+
+
+    def _on_finished(self):
+        """ Release the device once the buffer has played. Runs 
+            on the audio thread, which cannot close its own stream.
+        """
+        threading.Thread(target=self.stop, daemon=True).start()
+
+
+    def stop(self):
+        # Called from the Tk thread and after playback finishes
+        with self._lock:
+            stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+        # Only clear _current if a newer presentation has not
+        # replaced it
+        with Presentation._current_lock:
+            if Presentation._current is self:
+                Presentation._current = None
+
+
+    @classmethod
+    def stop_current(cls):
+        # The finisher thread can clear _current at any moment:
+        # read it once. stop() clears it.
+        current = cls._current
+        if current is not None:
+            current.stop()
+
+
+    def stats(self):
+        """ Status counts as a dict
+        """
+        return {
+            'callbacks': self.callbacks,
+            'underflows': self.underflows,
+            'priming_callbacks': self.priming,
+            'late_callbacks': self.late,
+            'stream_errors': self.errors,
+        }
+
+
+    def onset(self):
+        """ Scheduled and actual (DAC) onset on the stream clock,
+            and how late the onset was (ms). Values are None 
+            until the onset has been reached, or if the host does
+            not report stream times.
+        """
+        onset = {
+            'scheduled_time': self.start_time,
+            'onset_time': self.onset_time or None,
+            'onset_error_ms': None,
+        }
+        if self.start_time is not None and onset['onset_time'] is not None:
+            onset['onset_error_ms'] = \
+                (self.onset_time - self.start_time) * 1000
+        return onset
+
+
+class Untracked:
+    """ A presentation without stream status (played by a 
+        sink). Its counts are unknown, not zero.
+    """
+    def stats(self):
+        return None
+
+
+    def onset(self):
+        return None
+
+
+class LoopPlayer:
+    """ Play a buffer in a continuous loop from a stream callback.
+        The loop is cut at a seamless wrap point and routed once,
+        when the player is created. A feeder thread keeps a ring
+        buffer topped up with the loop; the callback only reads
+        from the ring, at the ring's gain.
+    """
+    # Audio queued ahead of the callback (s)
+    QUEUE = 0.2
+
+    def __init__(self, buffer, fs, device_id=None, speaker=None, 
+                 search=0.02):
+        """ buffer: 1-D or 2-D (frames, channels) signal
+            speaker: first output channel (1-based) to route to
+            search: length (s) at the end of the buffer searched 
+                for the wrap point
+        """
+        self.fs = fs
+        self.device_id = device_id
+        self.stream = None
+
+        # Cut at the wrap point
+        sig = np.asarray(buffer).reshape(len(buffer), -1)
+        end = self._wrap_point(sig, int(search * fs))
+        print(f"audiomodel: Loop wraps at sample {end} of {len(sig)}")
+
+        # Route channels, starting at speaker
+        first = 0 if speaker is None else speaker - 1
+        self.num_outputs = first + sig.shape[1]
+        self._loop = np.zeros((end, self.num_outputs), dtype=np.float32)
+        self._loop[:, first:] = sig[:end]
+        self._pos = 0
+        self._settings = Audio.stream_settings(device_id, fs,
+            self.num_outputs)
+
+        self._ring = ringbuffermodel.RingBuffer(
+            int(self.QUEUE * fs), self.num_outputs)
+        self._stopping = threading.Event()
+        self._feeder = None
+
+
+    @staticmethod
+    def _wrap_point(sig, search):
+        """ Find the end index for which jumping back to the first 
+            sample is smoothest. Each candidate is scored by how 
+            well the samples on either side of the jump predict 
+            each other (linear extrapolation).
+        """
+        n = len(sig)
+        if n < 4:
+            return n
+        lo = max(2, n - search)
+        ends = np.arange(lo, n + 1)
+        prev1 = sig[ends - 1]
+        prev2 = sig[ends - 2]
+        # Forward: continuing the tail should land on sig[0]
+        fwd = np.abs(2 * prev1 - prev2 - sig[0])
+        # Backward: extending the head backward should land on the tail
+        bwd = np.abs(prev1 - (2 * sig[0] - sig[1]))
+        err = np.sum(fwd + bwd, axis=1)
+        # Prefer the longest loop among equally good candidates
+        return int(ends[::-1][np.argmin(err[::-1])])
+
+
+    def _fill(self):
+        """ Write the loop into the ring until it is full, 
+            wrapping around at the end of the loop
+        """
+        loop = self._loop
+        n = len(loop)
+        while True:
+            count = min(self._ring.writable, n - self._pos)
+            if count == 0:
+                return
+            self._ring.write(loop[self._pos:self._pos + count])
+            self._pos = (self._pos + count) % n
+
+
+    def _feed(self):
+        """ Feeder thread: top up the ring until stopped
+        """
+        while not self._stopping.wait(self.QUEUE / 4):
+            self._fill()
+
+
+    def _callback(self, outdata, frames, time, status):
+        """ Read the next block from the ring. Runs on the audio 
+            thread: no allocation, no locks.
+        """
+        self._ring.read_into(outdata)
+
+
+    def set_gain(self, gain):
+        """ Scale the output without rebuilding the loop; takes
+            effect on the next callback
+        """
+        self._ring.gain = gain
+
+
+    def stats(self):
+        """ Ring buffer counters (underruns mean the feeder fell
+            behind the callback)
+        """
+        return self._ring.stats()
+
+
+    def start(self):
+        """ Start looping from the top of the buffer
+        """
+        self.stop()
+        self._pos = 0
+
+        # Hand loop to sink instead of the sound card
+        if Audio.sink is not None:
+            Audio.sink(self._loop, self.fs, self.device_id, None)
+            return
+
+        try:
+            self.stream = sd.OutputStream(
+                samplerate=self.fs,
+                device=self.device_id,
+                channels=self.num_outputs,
+                dtype='float32',
+                callback=self._callback,
+                **self._settings
+            )
+        except sd.PortAudioError as e:
+            print(f"audiomodel: {e}")
+            messagebox.showerror(
+                title="Invalid Audio Device",
+                message="Cannot open audio device for looped playback!",
+                detail=f"{e}"
+            )
+            return
+
+        # Queue the top of the loop before the first callback
+        self._ring.clear()
+        self._fill()
+        self._stopping.clear()
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+        self.stream.start()
+        print("audiomodel: Looping audio until stopped")
+
+
+    def stop(self):
+        """ Stop looping and release the device
+        """
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+            print("audiomodel: Loop stopped")
+
+        if self._feeder is not None:
+            self._stopping.set()
+            self._feeder.join()
+            self._feeder = None
+            stats = self._ring.stats()
+            if stats['underruns']:
+                print(f"audiomodel: Loop underruns: {stats['underruns']} "
+                    f"({stats['missing_frames']} frames)")
@@ -10,9 +10,13 @@
 # Import system packages
 import os
 
+# Import data science packages
+import numpy as np
+
 # Import custom modules
 from models import audiomodel
-from functions import functions
+from models import profilemodel
+from functions import assets
 
 
 #########
@@ -21,20 +25,31 @@ from functions import functions
 class CalModel:
     """ Write provided dictionary to .csv
     """
-    def __init__(self, sessionpars):
+    def __init__(self, sessionpars, profiles=None, station=None):
         self.sessionpars = sessionpars
 
+        # Calibration offsets per device/speaker route
+        if profiles is None:
+            profiles = profilemodel.DeviceProfileModel(station=station)
+        self.profiles = profiles
+
+        # Decoded, pre-scaled calibration stimulus
+        self.cal = None
+        self._cal_buffer = None
+        self._cal_key = None
+
+        # Looped calibration playback
+        self.loop = None
+        self._loop_key = None
+
 
     def _get_cal_file(self):
         """ Load specified calibration file
         """
         print("calmodel: Locating calibration file...")
         if self.sessionpars['cal_file'].get() == 'cal_stim.wav':
-            self.cal_file = functions.resource_path('cal_stim.wav')
-            #self.cal_file = self.resource_path('cal_stim.wav')
-            file_exists = os.access(self.cal_file, os.F_OK)
-            if not file_exists:
-                self.cal_file = '.\\assets\\cal_stim.wav'
+            # Compiled temp location first, then local assets
+            self.cal_file = assets.find('cal_stim.wav')
         else: # Custom file was provided
             self.cal_file = self.sessionpars['cal_file'].get()
 
@@ -44,25 +59,92 @@ class CalModel:
     def _calc_offset(self):
         """ Calculate adjusted presentation level
         """
-        # Calculate SLM offset
         print("\ncalmodel: Calculating new presentation level...")
-        slm_offset = self.sessionpars['slm_reading'].get() - self.sessionpars['cal_scaling_factor'].get()
+
+        # Add reading to the calibration curve of the active route
+        # (raises LookupError if the device cannot be found)
+        self.profiles.add_point(
+            *self._route(),
+            dbfs=self.sessionpars['cal_scaling_factor'].get(),
+            spl=self.sessionpars['slm_reading'].get()
+        )
+        self.profiles.save()
+
+        # SLM offset of the fitted curve (what levels are set by)
+        slm_offset = self.profiles.get_offset(*self._route())
         self.sessionpars['slm_offset'].set(slm_offset)
+
         # Provide console feedback
         print(f"calmodel: Starting level (dB FS): " +
               f"{self.sessionpars['cal_scaling_factor'].get()}")
         print(f"calmodel: SLM reading (dB): " +
               f"{self.sessionpars['slm_reading'].get()}")
         print(f"calmodel: SLM offset: {slm_offset}")
+        print(f"calmodel: Route: {self.profiles.route_key(*self._route())}")
 
         # SLM offset not yet saved!
         # This must happen in controller using: self._save_sessionpars()
 
 
+    def _route(self):
+        """ Active device/speaker route
+        """
+        return (
+            self.sessionpars['audio_device'].get(),
+            self.sessionpars['speaker_number'].get()
+        )
+
+
+    def get_offset(self):
+        """ Return the SLM offset for the active route. Falls 
+            back on the session offset for uncalibrated routes.
+        """
+        return self.profiles.get_offset(
+            *self._route(),
+            default=self.sessionpars['slm_offset'].get()
+        )
+
+
+    def get_curve(self):
+        """ Return the calibration curve for the active route. 
+            Uncalibrated routes use the session offset.
+        """
+        curve = self.profiles.get_curve(*self._route())
+        if curve is None:
+            curve = profilemodel.CalCurve(
+                [[0.0, self.sessionpars['slm_offset'].get()]])
+        return curve
+
+
+    def spl_to_dbfs(self, spl):
+        """ Map dB SPL to dB FS on the active route. Takes a 
+            single value or an array of values.
+        """
+        return self.get_curve().to_dbfs(spl)
+
+
+    def dbfs_to_spl(self, dbfs):
+        """ Map dB FS to dB SPL on the active route. Takes a 
+            single value or an array of values.
+        """
+        return self.get_curve().to_spl(dbfs)
+
+
+    def reset_route(self):
+        """ Discard calibration points of the active route
+        """
+        print(f"calmodel: Clearing calibration for " +
+            f"{self.profiles.route_key(*self._route())}")
+        self.profiles.clear_route(*self._route())
+        self.profiles.save()
+
+
     def _calc_level(self, desired_spl):
         # Calculate presentation level
         self.sessionpars['db_level'].set(desired_spl)
-        scaled_level = desired_spl - self.sessionpars['slm_offset'].get()
+        scaled_level = float(self.spl_to_dbfs(desired_spl))
+        # Record the effective offset at this level
+        self.sessionpars['slm_offset'].set(desired_spl - scaled_level)
         self.sessionpars['scaling_factor'].set(scaled_level)
         print(f"calmodel: Desired level in dB: " +
               f"{self.sessionpars['db_level'].get()}")
@@ -74,16 +156,55 @@ class CalModel:
         # This must happen in controller using: self._save_sessionpars()
 
 
+    def _get_cal_buffer(self):
+        """ Return the decoded calibration stimulus, scaled to 
+            cal_scaling_factor. Only rebuilt when the file or 
+            the level changes.
+        """
+        level = self.sessionpars['cal_scaling_factor'].get()
+        key = (self.cal_file, os.path.getmtime(self.cal_file), level)
+        if key != self._cal_key:
+            print("calmodel: Building calibration buffer...")
+            # Only decode the file again if it changed
+            if self._cal_key is None or key[0:2] != self._cal_key[0:2]:
+                self.cal = audiomodel.Audio(file_path=self.cal_file)
+            # Contiguous and read-only, so it can be looped safely
+            buffer = np.ascontiguousarray(self.cal.prepare(level=level))
+            buffer.setflags(write=False)
+            self._cal_buffer = buffer
+            self._cal_key = key
+        return self._cal_buffer
+
+
     def play_cal(self):
         # Present calibration file
-        self.cal = audiomodel.Audio(file_path=self.cal_file)
-        self.cal.play(
-            level=self.sessionpars['cal_scaling_factor'].get(),
-            device_id=self.sessionpars['audio_device'].get()
-        )
+        buffer = self._get_cal_buffer()
+        device_id, speaker = self._route()
+
+        # Stop any running loop before starting over
+        self.stop_cal()
+
+        if self.sessionpars['cal_loop'].get():
+            # Loop until <<CalStop>>, reusing the player if 
+            # nothing has changed
+            key = (self._cal_key, device_id, speaker)
+            if key != self._loop_key:
+                self.loop = audiomodel.LoopPlayer(
+                    buffer, self.cal.fs, device_id=device_id, 
+                    speaker=speaker)
+                self._loop_key = key
+            self.loop.start()
+        else:
+            self.cal.play_buffer(
+                buffer,
+                device_id=device_id,
+                speaker=speaker
+            )
 
     
     def stop_cal(self):
+        if self.loop is not None:
+            self.loop.stop()
         try:
             self.cal.stop()
         except AttributeError:
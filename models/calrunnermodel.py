@@ -0,0 +1,247 @@
+""" Scripted calibration runs against a simulated sound level meter.
+
+    CalibrationRunner drives CalModel.play_cal and _calc_offset for
+    any number of device/speaker routes without a person reading an
+    SLM. Buffers are routed to a measurement source through the
+    Audio sink instead of the sound card. LoopbackSLM measures the
+    RMS level of the rendered buffer (Audio.rms) and passes it
+    through a simulated transducer.
+
+    Run from the project folder, e.g.:
+        python -m models.calrunnermodel --devices 0 1 --speakers 1 2
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+# Import data science packages
+import numpy as np
+
+# Import custom modules
+from models import audiomodel
+from models import calmodel
+from models import profilemodel
+from functions import headless
+
+
+#########
+# MODEL #
+#########
+class LoopbackSLM:
+    """ Software sound level meter. Reads the RMS level (dB FS) of
+        the last buffer it was sent and maps it to dB SPL through
+        a simulated transducer.
+    """
+    def __init__(self, sensitivity=100.0, max_spl=None, knee=3.0,
+                 noise=0.0, seed=None):
+        """ sensitivity: dB SPL for a 0 dB FS RMS signal. A float,
+                or a dict of {(device_id, speaker): float}
+            max_spl: level the transducer compresses towards
+                (None for a linear transducer)
+            knee: softness of the compression (dB)
+            noise: standard deviation of reading noise (dB)
+        """
+        self.sensitivity = sensitivity
+        self.max_spl = max_spl
+        self.knee = knee
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._buffer = None
+        self._route = None
+
+
+    def capture(self, buffer, fs, device_id, speaker):
+        """ Audio sink: keep the rendered buffer for reading
+        """
+        self._buffer = buffer
+        self._route = (device_id, speaker)
+
+
+    def transducer(self, dbfs, route):
+        """ dB SPL produced by a signal of dbfs RMS on route
+        """
+        if isinstance(self.sensitivity, dict):
+            sensitivity = self.sensitivity[route]
+        else:
+            sensitivity = self.sensitivity
+        spl = dbfs + sensitivity
+        if self.max_spl is not None:
+            # Smooth, monotonic approach to max_spl
+            spl = self.max_spl - self.knee * \
+                np.log1p(np.exp((self.max_spl - spl) / self.knee))
+        return spl
+
+
+    def measure(self, buffer, route):
+        """ Simulated SLM reading of buffer on route
+        """
+        dbfs = audiomodel.Audio.mag2db(audiomodel.Audio.rms(buffer))
+        spl = self.transducer(dbfs, route)
+        if self.noise:
+            spl = spl + self._rng.normal(0.0, self.noise)
+        return float(spl)
+
+
+    def read(self):
+        """ Reading of the last captured buffer
+        """
+        if self._buffer is None:
+            raise RuntimeError("calrunnermodel: Nothing has been played!")
+        return self.measure(self._buffer, self._route)
+
+
+def loopback_name(device_id):
+    """ Device name for routes calibrated against a simulated 
+        SLM, so they are never mistaken for (or need) a real 
+        device
+    """
+    return f"loopback {device_id}"
+
+
+class CalibrationRunner:
+    """ Calibrate and verify device/speaker routes against a
+        pluggable measurement source (anything with capture()
+        and read(), such as LoopbackSLM).
+    """
+    def __init__(self, slm, sessionpars=None, profiles=None):
+        self.slm = slm
+        if sessionpars is None:
+            sessionpars = headless.make_sessionpars()
+        self.sessionpars = sessionpars
+        self.sessionpars['cal_loop'].set(False)
+        self.calmodel = calmodel.CalModel(self.sessionpars, profiles=profiles)
+
+
+    def calibrate(self, device_id, speaker, levels):
+        """ Play the calibration stimulus at each dB FS level,
+            read the SLM and submit the reading
+        """
+        self.sessionpars['audio_device'].set(device_id)
+        self.sessionpars['speaker_number'].set(speaker)
+        self.calmodel._get_cal_file()
+        readings = []
+        for level in levels:
+            self.sessionpars['cal_scaling_factor'].set(level)
+            self.calmodel.play_cal()
+            reading = self.slm.read()
+            self.sessionpars['slm_reading'].set(reading)
+            self.calmodel._calc_offset()
+            readings.append(reading)
+        return readings
+
+
+    def verify(self, device_id, speaker, targets):
+        """ Present the calibration stimulus at each target SPL
+            using the fitted calibration and measure the result.
+            Returns a list of (target, scaling, measured) tuples;
+            measured is None if the level would clip.
+        """
+        route = (device_id, speaker)
+        cal = self.calmodel.cal
+        peak = np.max(np.abs(cal.signal))
+        results = []
+        for target in targets:
+            self.calmodel._calc_level(target)
+            scaling = self.sessionpars['scaling_factor'].get()
+            if peak * cal.db2mag(scaling) > 0.999:
+                results.append((target, scaling, None))
+                continue
+            measured = self.slm.measure(cal.prepare(level=scaling), route)
+            results.append((target, scaling, measured))
+        return results
+
+
+    def run(self, routes, levels, targets):
+        """ Calibrate and verify every route. Returns one record
+            per route/target.
+        """
+        records = []
+        old_sink = audiomodel.Audio.sink
+        audiomodel.Audio.sink = self.slm.capture
+        start = time.perf_counter()
+        try:
+            for device_id, speaker in routes:
+                route_start = time.perf_counter()
+                self.calibrate(device_id, speaker, levels)
+                results = self.verify(device_id, speaker, targets)
+                elapsed = time.perf_counter() - route_start
+                for target, scaling, measured in results:
+                    records.append({
+                        'device_id': device_id,
+                        'speaker': speaker,
+                        'target_spl': target,
+                        'scaling_factor': round(scaling, 3),
+                        'measured_spl': None if measured is None
+                            else round(measured, 3),
+                        'error_db': None if measured is None
+                            else round(measured - target, 3),
+                        'route_seconds': round(elapsed, 4),
+                    })
+        finally:
+            audiomodel.Audio.sink = old_sink
+        self.elapsed = time.perf_counter() - start
+        return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Calibrate device/speaker routes against a " +
+            "simulated sound level meter.")
+    parser.add_argument('--devices', type=int, nargs='+', default=[0])
+    parser.add_argument('--speakers', type=int, nargs='+', default=[1])
+    parser.add_argument('--levels', type=float, nargs='+',
+        default=[-40.0, -30.0, -20.0], help="calibration levels (dB FS)")
+    parser.add_argument('--targets', type=float, nargs='+',
+        default=[50.0, 65.0, 85.0], help="levels to verify (dB SPL)")
+    parser.add_argument('--sensitivity', type=float, default=100.0,
+        help="simulated dB SPL for a 0 dB FS RMS signal")
+    parser.add_argument('--max-spl', type=float, default=None,
+        help="simulated transducer compression limit (dB SPL)")
+    parser.add_argument('--noise', type=float, default=0.0,
+        help="simulated reading noise (dB)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--profiles', default=None,
+        help="profiles file to write (default: a temp file)")
+    parser.add_argument('--out', default='calibration_runs.csv')
+    args = parser.parse_args(argv)
+
+    # Never touch the user's profiles unless asked to
+    profiles_path = args.profiles or os.path.join(
+        tempfile.mkdtemp(), 'profiles.json')
+    profiles = profilemodel.DeviceProfileModel(profiles_path,
+        query=loopback_name)
+
+    slm = LoopbackSLM(sensitivity=args.sensitivity, max_spl=args.max_spl,
+        noise=args.noise, seed=args.seed)
+    runner = CalibrationRunner(slm, profiles=profiles)
+    routes = [(d, s) for d in args.devices for s in args.speakers]
+    records = runner.run(routes, args.levels, args.targets)
+
+    # Write results
+    with open(args.out, 'w', newline='') as fh:
+        csvwriter = csv.DictWriter(fh, fieldnames=records[0].keys())
+        csvwriter.writeheader()
+        csvwriter.writerows(records)
+
+    errors = [abs(r['error_db']) for r in records if r['error_db'] is not None]
+    clipped = sum(r['error_db'] is None for r in records)
+    print(f"\ncalrunnermodel: {len(routes)} routes in " +
+        f"{runner.elapsed:.3f} s ({len(routes)/runner.elapsed:.1f} routes/s)")
+    if errors:
+        print(f"calrunnermodel: Max abs error: {max(errors):.3f} dB")
+    print(f"calrunnermodel: Clipped targets: {clipped}")
+    print(f"calrunnermodel: Results written to {args.out}")
+    print(f"calrunnermodel: Profiles written to {profiles_path}")
+
+
+if __name__ == "__main__":
+    main()
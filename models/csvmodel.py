@@ -17,24 +17,29 @@ import os
 class CSVModel:
     """ Write provided dictionary to .csv
     """
-    def __init__(self, sessionpars):
+    def __init__(self, sessionpars, station=None):
         self.sessionpars = sessionpars
+        self.station = station
 
         # Generate date stamp
         self.datestamp = datetime.now().strftime("%Y_%b_%d_%H%M")
 
     
     #def save_record(self, data):
-    def save_record(self):
+    def save_record(self, extra=None):
         """ Save a dictionary of data to .csv file 
+            extra: dict of additional columns (e.g., stream status)
         """
         # Check for existing data folder
+        # Stations write to their own subfolder
         data_directory = "Data"
+        if self.station:
+            data_directory = os.path.join(data_directory, self.station)
         data_dir_exists = os.access(data_directory, os.F_OK)
         if not data_dir_exists:
             print(f"\ncsvmodel: {data_directory} directory not found! " + 
                 "Creating it...")
-            os.mkdir(data_directory)
+            os.makedirs(data_directory)
             print(f"csvmodel: Successfully created {data_directory} " +
                   "directory!")
         
@@ -62,13 +67,21 @@ class CSVModel:
         [data.pop(key) for key in [
             'stim_file_path', 
             'cal_file',
+            'cal_loop',
             'audio_device',
             'speaker_number',
+            'presentation_preroll',
+            'trigger_channel',
+            'trigger_width',
             'check_for_updates',
             'update_path',
             ]
         ]
 
+        # Add extra columns
+        if extra:
+            data.update(extra)
+
         # Write file
         newfile = not self.file.exists()
         with open(self.file, 'a', newline='') as fh:
@@ -0,0 +1,411 @@
+""" Out-of-process audio engine.
+
+    Playback runs in a child process, away from the Tk main loop,
+    so dialogs and plots cannot delay audio submission. Stimulus
+    buffers are copied once into shared memory and attached by
+    the engine by name; only short commands go over the pipe:
+
+        attach   map a shared buffer into the engine
+        play     start a buffer on a device/channel at a gain
+        status   stream status and onset of a presentation
+        gain     change the gain of the buffer that is playing
+        stop     stop playback
+        release  unmap a buffer (before it is unlinked)
+        quit     stop and exit
+
+    The gain is applied in the stream callback, so the same shared
+    buffer can be presented at any level without a new copy. A few
+    buffers are kept attached (least recently used are released).
+
+    Enable with:
+        python controller.py --audio-engine
+    Add --realtime to apply the real-time measures (realtimemodel)
+    in the engine, where the streams are opened.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import itertools
+import multiprocessing as mp
+import os
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+from functions.portaudio import sd
+
+# Import custom modules
+from models import audiomodel
+from models import realtimemodel
+
+
+#########
+# MODEL #
+#########
+def share_resource_tracker():
+    """ Start this process's resource tracker before any child 
+        process is made, so children use it instead of starting 
+        their own. A child's own tracker would unlink every block
+        the child attached when the child exits, including blocks
+        the parent still owns.
+    """
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+
+
+def _attach_shared(name):
+    """ Attach to an existing shared memory block without making
+        this process responsible for removing it
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the block. This only 
+        # repeats the owner's registration, as long as the process
+        # uses the tracker started by share_resource_tracker().
+        return shared_memory.SharedMemory(name=name)
+
+
+class _Player(audiomodel.Presentation):
+    """ One presentation of a shared buffer at a gain. Runs in the
+        engine; counts stream status and schedules the onset like
+        any Presentation.
+    """
+    def __init__(self, data, fs, device_id, speaker, gain, **settings):
+        # Not enough outputs: drop file channels (as Audio.play)
+        outputs = sd.query_devices(device_id)['max_output_channels']
+        first = 0 if speaker is None else speaker - 1
+        if first + data.shape[1] > outputs:
+            speaker = None
+            data = data[:, :outputs]
+        super().__init__(data, fs, device_id, speaker, **settings)
+        self.gain = np.float32(gain)
+
+
+    def _callback(self, outdata, frames, time, status):
+        """ Copy the next block at the current gain
+        """
+        try:
+            super()._callback(outdata, frames, time, status)
+        finally:
+            gain = self.gain
+            if gain != 1.0:
+                np.multiply(outdata, gain, out=outdata)
+
+
+    def status(self):
+        return {'stats': self.stats(), 'onset': self.onset()}
+
+
+class _Engine:
+    """ Command loop of the engine process
+    """
+    # Status of finished presentations kept for the parent
+    KEEP = 256
+
+    def __init__(self, conn, realtime=None):
+        """ realtime: realtimemodel.RealtimeMode applied around 
+                each presentation, or None
+        """
+        self.conn = conn
+        self.realtime = realtime
+        # key -> (SharedMemory, array, fs)
+        self.buffers = {}
+        self.player = None
+        self.playing = None
+        # Presentation id -> status
+        self.results = OrderedDict()
+        self.play_id = None
+
+
+    def run(self):
+        while True:
+            try:
+                seq, cmd, *args = self.conn.recv()
+            except EOFError:
+                # Parent went away
+                seq, cmd, args = None, 'quit', []
+            try:
+                reply = getattr(self, f"_cmd_{cmd}")(*args)
+            except Exception as e:
+                reply = ('error', (type(e).__name__, str(e)))
+            if cmd == 'quit':
+                break
+            # Echo the sequence number so late answers can be told apart
+            self.conn.send((seq, *reply))
+
+
+    def _cmd_attach(self, key, name, shape, dtype, fs):
+        shm = _attach_shared(name)
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.buffers[key] = (shm, array, fs)
+        return ('ok', None)
+
+
+    def _cmd_play(self, key, device_id, speaker, gain, settings, play_id):
+        self._cmd_stop()
+        shm, array, fs = self.buffers[key]
+        player = _Player(array, fs, device_id, speaker, gain, **settings)
+        if self.realtime is None:
+            player.start()
+        else:
+            with self.realtime.presentation(array):
+                player.start()
+        self.player = player
+        self.playing = key
+        self.play_id = play_id
+        return ('ok', None)
+
+
+    def _cmd_status(self, play_id):
+        if play_id == self.play_id and self.player is not None:
+            return ('ok', self.player.status())
+        return ('ok', self.results.get(play_id))
+
+
+    def _cmd_gain(self, gain):
+        if self.player is not None:
+            self.player.gain = np.float32(gain)
+        return ('ok', None)
+
+
+    def _cmd_stop(self):
+        if self.player is not None:
+            self.player.stop()
+            self.results[self.play_id] = self.player.status()
+            while len(self.results) > self.KEEP:
+                self.results.popitem(last=False)
+            self.player = None
+            self.playing = None
+            self.play_id = None
+        return ('ok', None)
+
+
+    def _cmd_release(self, key):
+        if key == self.playing:
+            self._cmd_stop()
+        shm, array, fs = self.buffers.pop(key)
+        # Views must be gone before the block can be closed
+        del array
+        shm.close()
+        return ('ok', None)
+
+
+    def _cmd_quit(self):
+        self._cmd_stop()
+        for key in list(self.buffers):
+            self._cmd_release(key)
+        if self.realtime is not None:
+            self.realtime.release()
+            print("\n".join(self.realtime.report()))
+
+
+def _engine_main(conn, realtime=False):
+    """ Entry point of the engine process
+    """
+    _Engine(conn,
+        realtimemodel.RealtimeMode() if realtime else None).run()
+
+
+class AudioEngine:
+    """ Parent-side handle to the engine process
+    """
+    # Engine errors raised again as these types (else RuntimeError)
+    ERRORS = {
+        'PortAudioError': sd.PortAudioError,
+        'ValueError': ValueError,
+    }
+
+    def __init__(self, slots=4, timeout=5.0, realtime=False):
+        """ slots: buffers kept attached at once
+            timeout: seconds to wait for the engine to answer
+            realtime: apply real-time measures in the engine
+        """
+        self.slots = slots
+        self.timeout = timeout
+        self.realtime = realtime
+        self.process = None
+        self._conn = None
+        # key -> dict(shm, source, peak)
+        self._buffers = OrderedDict()
+        self._keys = itertools.count()
+        self._play_ids = itertools.count()
+        # Request numbers (answers carry the number they answer)
+        self._seq = itertools.count()
+
+
+    def start(self):
+        """ Start the engine process
+        """
+        share_resource_tracker()
+        self._conn, child = mp.Pipe()
+        self.process = mp.Process(target=_engine_main,
+            args=(child, self.realtime), name='audio-engine', daemon=True)
+        self.process.start()
+        child.close()
+        print(f"\nenginemodel: Audio engine running (pid {self.process.pid})")
+
+
+    def _call(self, *cmd):
+        """ Send a command and wait for the engine's answer
+        """
+        if self.process is None or not self.process.is_alive():
+            raise RuntimeError("enginemodel: Audio engine is not running!")
+        seq = next(self._seq)
+        self._conn.send((seq, *cmd))
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._conn.poll(remaining):
+                raise TimeoutError(f"enginemodel: No answer to '{cmd[0]}'")
+            answered, status, value = self._conn.recv()
+            if answered == seq:
+                break
+            # Late answer to a request that already timed out
+            print(f"enginemodel: Discarding late answer to request {answered}")
+        if status == 'error':
+            name, message = value
+            # Same exception types as playing in this process
+            error = self.ERRORS.get(name, RuntimeError)
+            raise error(f"enginemodel: {cmd[0]} failed: {name}: {message}")
+        return value
+
+
+    def attach(self, buffer, fs):
+        """ Share buffer with the engine and return its key. The
+            same buffer object is only copied once while it stays
+            in a slot.
+        """
+        for key, slot in self._buffers.items():
+            if slot['source'] is buffer:
+                self._buffers.move_to_end(key)
+                return key
+
+        while len(self._buffers) >= self.slots:
+            self.release(next(iter(self._buffers)))
+
+        # Copy once into shared memory, as float32 frames x channels
+        src = np.asarray(buffer)
+        src = src.reshape(len(src), -1)
+        shm = shared_memory.SharedMemory(create=True,
+            size=max(src.size * 4, 1))
+        shared = np.ndarray(src.shape, dtype=np.float32, buffer=shm.buf)
+        shared[:] = src
+        peak = float(np.max(np.abs(shared))) if shared.size else 0.0
+        del shared
+
+        key = next(self._keys)
+        try:
+            self._call('attach', key, shm.name, src.shape, 'float32', fs)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        self._buffers[key] = {'shm': shm, 'source': buffer, 'peak': peak}
+        return key
+
+
+    def peak(self, key):
+        """ Peak magnitude of an attached buffer
+        """
+        return self._buffers[key]['peak']
+
+
+    def play(self, key, device_id=None, speaker=None, gain=1.0, **settings):
+        """ Play an attached buffer at gain (magnitude). settings:
+            blocksize, latency, preroll (see 
+            audiomodel.Presentation). Returns an EnginePresentation.
+        """
+        self._buffers.move_to_end(key)
+        play_id = next(self._play_ids)
+        self._call('play', key, device_id, speaker, float(gain), settings,
+            play_id)
+        return EnginePresentation(self, play_id)
+
+
+    def set_gain(self, gain):
+        """ Change the gain of the buffer that is playing
+        """
+        self._call('gain', float(gain))
+
+
+    def stop(self):
+        self._call('stop')
+
+
+    def release(self, key):
+        """ Detach a buffer from the engine and free it
+        """
+        slot = self._buffers.pop(key)
+        try:
+            self._call('release', key)
+        finally:
+            slot['shm'].close()
+            slot['shm'].unlink()
+
+
+    def close(self):
+        """ Stop the engine and free all shared buffers
+        """
+        if self.process is not None and self.process.is_alive():
+            self._conn.send((next(self._seq), 'quit'))
+            self.process.join(self.timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(self.timeout)
+            # A stalled engine may ignore SIGTERM
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        for slot in self._buffers.values():
+            slot['shm'].close()
+            slot['shm'].unlink()
+        self._buffers.clear()
+        self.process = None
+        print("enginemodel: Audio engine stopped")
+
+
+    def restart(self):
+        """ Replace a dead or stalled engine with a new one. 
+            Attached buffers are dropped; they are attached again 
+            when next played.
+        """
+        self.close()
+        self.start()
+
+
+class EnginePresentation:
+    """ Parent-side view of one presentation in the engine, with 
+        the stats() and onset() of audiomodel.Presentation (None 
+        when the engine cannot tell)
+    """
+    def __init__(self, engine, play_id):
+        self.engine = engine
+        self.play_id = play_id
+
+
+    def _status(self):
+        try:
+            return self.engine._call('status', self.play_id)
+        except (RuntimeError, TimeoutError) as e:
+            print(e)
+            return None
+
+
+    def stats(self):
+        status = self._status()
+        return None if status is None else status['stats']
+
+
+    def onset(self):
+        status = self._status()
+        return None if status is None else status['onset']
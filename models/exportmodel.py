@@ -0,0 +1,238 @@
+""" Headless batch export of tick trains over parameter grids.
+
+    Every combination of stimulus source, ISI mode, isi, jitter,
+    train_reps and seed is rendered with TickModel across a pool
+    of worker processes. Sources are the stimulus file ('file')
+    or the synthesized ticks of SynthModel; each worker decodes
+    the file and builds each synthesized tick once. The grid is
+    checked before anything is rendered, so settings TickModel
+    cannot render stop the export before any file is written.
+    Files get deterministic names, and a manifest.csv lists what
+    was written.
+
+    Run from the project folder, e.g.:
+        python -m models.exportmodel tick.wav --isi 40 60
+            --jitter 0 0.5 --reps 10 20 --seeds 1 2 3 --out stimuli
+        python -m models.exportmodel --sources click tone_pip
+            --isi-mode offset onset --isi 10 --jitter 2 --out stimuli
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import argparse
+import csv
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Import audio packages
+import soundfile as sf
+
+# Import custom modules
+from models import audiomodel
+from models import synthmodel
+from models import tickmodel
+from functions import headless
+
+
+#########
+# MODEL #
+#########
+# Stimulus sources: the stimulus file, or a synthesized tick
+SOURCES = ('file',) + synthmodel.SynthModel.SOURCES
+
+# Per worker process: the decoded stimulus file, the synthesis
+# settings and the synthesized ticks made so far
+_audio = None
+_synth = {}
+_synth_audio = {}
+
+
+def _init_worker(stim_path, synth):
+    """ Decode the stimulus file (if any) in each worker
+    """
+    global _audio, _synth
+    if stim_path is not None:
+        _audio = audiomodel.Audio(Path(stim_path))
+    _synth = synth
+
+
+def _source_audio(source):
+    """ Audio for a stimulus source. Runs in a worker.
+    """
+    if source == 'file':
+        return _audio
+    if source not in _synth_audio:
+        sessionpars = headless.make_sessionpars(stim_source=source, **_synth)
+        _synth_audio[source] = synthmodel.SynthModel(sessionpars).make_audio()
+    return _synth_audio[source]
+
+
+def export_name(isi, jitter, reps, seed, source='file', isi_mode='offset'):
+    """ File name for one combination (matches the name used by
+        the Session dialog export, plus the seed). Synthesized 
+        sources and onset mode are added in front.
+    """
+    name = f"isi{isi}_jitter{jitter}_reps{reps}_seed{seed}.wav"
+    if isi_mode != 'offset':
+        name = f"{isi_mode}_{name}"
+    if source != 'file':
+        name = f"{source}_{name}"
+    return name
+
+
+def _sessionpars(job):
+    """ Session parameters for one job
+    """
+    source, isi_mode, isi, jitter, reps, seed, out_dir = job
+    return headless.make_sessionpars(stim_source=source, isi_mode=isi_mode,
+        isi=isi, jitter=jitter, train_reps=reps)
+
+
+def check_jobs(jobs):
+    """ Raise ValueError listing every job TickModel cannot 
+        render, before any job is started
+    """
+    errors = []
+    for job in jobs:
+        source, isi_mode, isi, jitter, reps, seed, _ = job
+        try:
+            # TickModel checks its settings on creation
+            tickmodel.TickModel(_sessionpars(job), None)
+        except ValueError as e:
+            name = export_name(isi, jitter, reps, seed, source, isi_mode)
+            errors.append(f"  {name}: {e}")
+    if errors:
+        raise ValueError(f"exportmodel: {len(errors)} of {len(jobs)} " +
+            "combinations cannot be rendered:\n" + "\n".join(errors))
+
+
+def render(job):
+    """ Render and write one tick train. Runs in a worker.
+    """
+    source, isi_mode, isi, jitter, reps, seed, out_dir = job
+    audio = _source_audio(source)
+
+    # TickModel draws its jitter from the random module
+    random.seed(seed)
+    train = tickmodel.TickModel(_sessionpars(job), audio).make_train()
+
+    name = export_name(isi, jitter, reps, seed, source, isi_mode)
+    sf.write(os.path.join(out_dir, name), train, audio.fs)
+    return {
+        'file': name,
+        'source': source,
+        'isi_mode': isi_mode,
+        'isi': isi,
+        'jitter': jitter,
+        'train_reps': reps,
+        'seed': seed,
+        'samples': len(train),
+        'duration_s': round(len(train) / audio.fs, 6),
+        'fs': audio.fs,
+    }
+
+
+def export_grid(stim_path, isis, jitters, reps, seeds, out_dir,
+                workers=None, sources=('file',), isi_modes=('offset',),
+                synth=None):
+    """ Render all combinations in parallel. Returns the
+        manifest records. stim_path is only needed for the 
+        'file' source; synth holds SynthModel settings 
+        (synth_fs, synth_dur, ...) for the other sources.
+    """
+    if 'file' in sources and stim_path is None:
+        raise ValueError("exportmodel: The 'file' source needs a " +
+            "stimulus file")
+    jobs = [
+        (src, mode, float(i), float(j), int(r), int(s), out_dir)
+        for src, mode, i, j, r, s in itertools.product(
+            sources, isi_modes, isis, jitters, reps, seeds)
+    ]
+    check_jobs(jobs)
+    if 'file' not in sources:
+        stim_path = None
+
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    initargs = (None if stim_path is None else str(stim_path),
+        dict(synth or {}))
+    with ProcessPoolExecutor(max_workers=workers,
+            initializer=_init_worker, initargs=initargs) as pool:
+        records = list(pool.map(render, jobs, chunksize=chunksize))
+
+    # Write manifest
+    manifest = os.path.join(out_dir, 'manifest.csv')
+    with open(manifest, 'w', newline='') as fh:
+        csvwriter = csv.DictWriter(fh,
+            fieldnames=['stim_file'] + list(records[0].keys()))
+        csvwriter.writeheader()
+        for record in records:
+            stim_file = str(stim_path) if record['source'] == 'file' else ''
+            csvwriter.writerow({'stim_file': stim_file, **record})
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export tick trains for every combination of " +
+            "the given parameters.")
+    defaults = headless.make_sessionpars()
+    parser.add_argument('stim', nargs='?', default=None,
+        help="single tick .wav file (for the 'file' source)")
+    parser.add_argument('--sources', nargs='+', choices=SOURCES,
+        default=['file'], help="stimulus source(s)")
+    parser.add_argument('--isi-mode', nargs='+', choices=('offset', 'onset'),
+        default=['offset'], help="ISI measured from tick offset or onset")
+    parser.add_argument('--isi', type=float, nargs='+', default=[60.0],
+        help="inter-stimulus interval(s) (ms)")
+    parser.add_argument('--jitter', type=float, nargs='+', default=[0.5],
+        help="jitter (ms)")
+    parser.add_argument('--reps', type=int, nargs='+', default=[10],
+        help="train reps")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0],
+        help="random seeds for the jitter")
+    parser.add_argument('--synth-fs', type=int,
+        default=defaults['synth_fs'].get(),
+        help="sampling rate of synthesized ticks (Hz)")
+    parser.add_argument('--synth-dur', type=float,
+        default=defaults['synth_dur'].get(),
+        help="tone pip and noise burst duration (ms)")
+    parser.add_argument('--synth-freq', type=float,
+        default=defaults['synth_freq'].get(),
+        help="tone pip frequency (Hz)")
+    parser.add_argument('--synth-ramp', type=float,
+        default=defaults['synth_ramp'].get(),
+        help="tone pip and noise burst ramps (ms)")
+    parser.add_argument('--click-dur', type=float,
+        default=defaults['click_dur'].get(),
+        help="click duration (ms)")
+    parser.add_argument('--out', default='exported_stimuli')
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    synth = {key: getattr(args, key) for key in ('synth_fs', 'synth_dur',
+        'synth_freq', 'synth_ramp', 'click_dur')}
+
+    start = time.perf_counter()
+    try:
+        records = export_grid(args.stim, args.isi, args.jitter, args.reps,
+            args.seeds, args.out, workers=args.workers,
+            sources=args.sources, isi_modes=args.isi_mode, synth=synth)
+    except ValueError as e:
+        parser.exit(2, f"{e}\n")
+    elapsed = time.perf_counter() - start
+    print(f"\nexportmodel: Wrote {len(records)} files to {args.out} " +
+        f"in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
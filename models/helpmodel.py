@@ -0,0 +1,106 @@
+""" Model to render README.md as an html help page.
+
+    The rendered page is cached next to a small stamp file that
+    holds the README's mtime and hash. The page is only rebuilt
+    when the README has changed, and rendering runs on a
+    background thread so the Tk window never stalls.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+#########
+# MODEL #
+#########
+class HelpModel:
+    """ Render README.md to html and cache the result
+    """
+    # Interval between checks on the background render (ms)
+    POLL_MS = 50
+
+    def __init__(self, readme='README.md',
+                 html=os.path.join('assets', 'README', 'README.html')):
+        self.readme = Path(readme)
+        self.html = Path(html)
+        self.stamp = self.html.with_suffix('.json')
+
+        # Only one render at a time
+        self._lock = threading.Lock()
+
+
+    def render(self):
+        """ Rebuild the html page if README.md has changed.
+            Returns the path to the html page.
+        """
+        with self._lock:
+            mtime = os.stat(self.readme).st_mtime_ns
+            stamp = self._read_stamp()
+
+            # Unchanged mtime: nothing to do
+            if self.html.exists() and stamp.get('mtime') == mtime:
+                print("helpmodel: Using cached help file")
+                return self.html
+
+            # Changed mtime, but maybe not changed content
+            with open(self.readme, 'rb') as fh:
+                raw = fh.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if not (self.html.exists() and stamp.get('sha256') == digest):
+                print("helpmodel: README changed - rendering help file...")
+                # Only import markdown when it is actually needed
+                import markdown
+                html = markdown.markdown(raw.decode('utf-8'))
+                tmp = self.html.with_suffix('.tmp')
+                with open(tmp, 'w', encoding='utf-8') as fh:
+                    fh.write(html)
+                os.replace(tmp, self.html)
+
+            # Update stamp
+            with open(self.stamp, 'w') as fh:
+                json.dump({'mtime': mtime, 'sha256': digest}, fh)
+
+            return self.html
+
+
+    def render_async(self, root, callback):
+        """ Render on a background thread. callback(path, error)
+            is called on the Tk thread via root.after().
+        """
+        result = {}
+
+        def work():
+            try:
+                result['path'] = self.render()
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+
+        def poll():
+            if thread.is_alive():
+                root.after(self.POLL_MS, poll)
+                return
+            callback(result.get('path'), result.get('error'))
+
+        root.after(self.POLL_MS, poll)
+
+
+    def _read_stamp(self):
+        """ Load the stamp of the last render
+        """
+        try:
+            with open(self.stamp, 'r') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
@@ -0,0 +1,205 @@
+""" Opt-in memory profiling for long sessions.
+
+    MemoryProfiler uses tracemalloc to snapshot Python allocations
+    at points in the trial loop (start and save of each trial).
+    Each snapshot records the traced total, resident memory, open
+    Matplotlib figures and the top allocating source lines. At
+    quit, a report compares the first and last snapshots and
+    flags memory that grew at every trial.
+
+    Enable with:
+        python controller.py --memprofile [REPORT]
+
+    Tracing slows allocations down; do not leave it on for real
+    sessions.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import os
+import time
+import tracemalloc
+
+# Import data science packages
+import matplotlib.pyplot as plt
+
+# Import custom modules
+from models.simmodel import rss_bytes
+
+
+#########
+# MODEL #
+#########
+class MemoryProfiler:
+    """ tracemalloc snapshots taken at labelled points
+    """
+    # Allocations made by the profiler itself are not interesting
+    _filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+
+    def __init__(self, report='memprofile_report.txt', top=10, frames=1,
+                 track=50, min_growth=1024):
+        """ report: file written by write_report()
+            top: allocators listed per snapshot
+            frames: traceback depth stored per allocation
+            track: allocators followed across snapshots to look
+                for steady growth
+            min_growth: bytes per trial a source line must grow
+                by to be flagged (the records kept here grow too)
+        """
+        self.report = report
+        self.top = top
+        self.frames = frames
+        self.track = track
+        self.min_growth = min_growth
+
+        self.records = []
+        self._first = None
+        self._last = None
+        # Source line -> list of sizes, one per snapshot
+        self._lines = {}
+
+
+    def start(self):
+        """ Start tracing and take the baseline snapshot
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        print(f"\nmemprofilemodel: Tracing allocations " +
+            f"({self.frames} frame(s))")
+        self.snapshot('baseline')
+
+
+    def _take(self):
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+
+    def snapshot(self, label):
+        """ Snapshot allocations and record the top allocators
+            since the previous snapshot
+        """
+        if not tracemalloc.is_tracing():
+            return
+        snap = self._take()
+        current, peak = tracemalloc.get_traced_memory()
+
+        if self._last is None:
+            stats = snap.statistics('lineno')
+        else:
+            stats = snap.compare_to(self._last, 'lineno')
+        top = [str(stat) for stat in stats[:self.top]]
+
+        # Follow the biggest allocators across snapshots
+        sizes = {str(stat.traceback): stat.size
+            for stat in snap.statistics('lineno')[:self.track]}
+        n = len(self.records)
+        for line in set(self._lines) | set(sizes):
+            history = self._lines.setdefault(line, [0] * n)
+            history.append(sizes.get(line, 0))
+
+        self.records.append({
+            'label': label,
+            'time': time.strftime('%H:%M:%S'),
+            'traced': current,
+            'peak': peak,
+            'rss': rss_bytes(),
+            'figures': len(plt.get_fignums()),
+            'top': top,
+        })
+        print(f"memprofilemodel: {label}: traced " +
+            f"{current / 1024:.0f} KiB, figures {len(plt.get_fignums())}")
+
+        if self._first is None:
+            self._first = snap
+        self._last = snap
+
+
+    @staticmethod
+    def _growing(values, min_growth=0):
+        """ True if values never fall and grow by more than
+            min_growth per step on average
+        """
+        if len(values) < 3:
+            return False
+        step = (values[-1] - values[0]) / (len(values) - 1)
+        return step > min_growth and \
+            all(b >= a for a, b in zip(values, values[1:]))
+
+
+    def growth(self, label=None):
+        """ Return the growth flags: whether the traced total,
+            resident memory and figure count grew at every
+            snapshot (optionally only snapshots whose label ends
+            with label), plus the source lines that did
+        """
+        idx = [i for i, r in enumerate(self.records)
+            if label is None or r['label'].endswith(label)]
+        flags = {}
+        for key in ('traced', 'rss', 'figures'):
+            values = [self.records[i][key] for i in idx]
+            if None not in values:
+                flags[key] = self._growing(values)
+        lines = [line for line, sizes in self._lines.items()
+            if self._growing([sizes[i] for i in idx], self.min_growth)]
+        return flags, lines
+
+
+    def write_report(self, path=None):
+        """ Write per-snapshot totals, top allocators and the
+            first-to-last diff. Stops tracing.
+        """
+        path = path or self.report
+        if self._first is None:
+            return
+
+        # Final state
+        self.snapshot('quit')
+        flags, lines = self.growth(label='save')
+        diff = self._last.compare_to(self._first, 'lineno')
+
+        with open(path, 'w') as fh:
+            fh.write("Memory profile\n==============\n\n")
+            fh.write(f"{'snapshot':<24}{'time':>10}{'traced KiB':>14}" +
+                f"{'peak KiB':>12}{'rss MiB':>10}{'figures':>9}\n")
+            for r in self.records:
+                rss = '' if r['rss'] is None else f"{r['rss'] / 2**20:.1f}"
+                fh.write(f"{r['label']:<24}{r['time']:>10}" +
+                    f"{r['traced'] / 1024:>14.0f}{r['peak'] / 1024:>12.0f}" +
+                    f"{rss:>10}{r['figures']:>9}\n")
+
+            fh.write("\nGrowth across saved trials\n")
+            fh.write("--------------------------\n")
+            for key, growing in flags.items():
+                fh.write(f"{key}: {'GROWING' if growing else 'ok'}\n")
+            for line in lines:
+                fh.write(f"GROWING: {line}\n")
+
+            fh.write(f"\nTop {self.top} changes, first to last snapshot\n")
+            fh.write("-------------------------------------------\n")
+            for stat in diff[:self.top]:
+                fh.write(f"{stat}\n")
+
+            fh.write("\nTop allocators per snapshot\n")
+            fh.write("---------------------------\n")
+            for r in self.records:
+                fh.write(f"\n[{r['label']}]\n")
+                for stat in r['top']:
+                    fh.write(f"  {stat}\n")
+
+        tracemalloc.stop()
+        print(f"memprofilemodel: Report written to {os.path.abspath(path)}")
+        for key, growing in flags.items():
+            if growing:
+                print(f"memprofilemodel: WARNING - {key} grew every trial")
+        if lines:
+            print(f"memprofilemodel: WARNING - {len(lines)} source " +
+                "line(s) grew every trial (see report)")
@@ -0,0 +1,326 @@
+""" Model for storing per-device calibration profiles.
+
+    Calibration offsets are stored per route: the audio device
+    name plus the output channel (speaker number). Switching
+    routes picks up the stored offset without recalibrating.
+
+    Each route can hold SLM readings taken at several dB FS
+    levels. A monotonic curve is fit through them so levels
+    stay accurate where the transducer compresses.
+
+    Devices can also hold stream settings (blocksize and
+    latency) found by the tuner (see tunermodel).
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import os
+import time
+from pathlib import Path
+from datetime import datetime
+
+# Import data handling packages
+import json
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+from functions.portaudio import sd
+
+
+#########
+# MODEL #
+#########
+class CalCurve:
+    """ Monotonic mapping between dB FS and dB SPL, fit through 
+        calibration points. Outside the measured range the 
+        offset of the nearest point is used.
+    """
+    def __init__(self, points):
+        """ points: list of [dB FS, dB SPL] pairs
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        order = np.argsort(points[:, 0], kind='stable')
+        dbfs = points[order, 0]
+        spl = self._isotonic(points[order, 1])
+
+        # Flat stretches cannot be inverted: keep the lowest 
+        # dB FS for each SPL value
+        self.spl, first = np.unique(spl, return_index=True)
+        self.dbfs = dbfs[first]
+
+        # Offsets used beyond either end of the table
+        self.offset_low = self.spl[0] - self.dbfs[0]
+        self.offset_high = self.spl[-1] - self.dbfs[-1]
+
+
+    @staticmethod
+    def _isotonic(y):
+        """ Non-decreasing least-squares fit (pool adjacent 
+            violators).
+        """
+        values = []
+        weights = []
+        for v in y:
+            values.append(v)
+            weights.append(1)
+            while len(values) > 1 and values[-2] > values[-1]:
+                w = weights[-2] + weights[-1]
+                v = (values[-2] * weights[-2] + values[-1] * weights[-1]) / w
+                values[-2:] = [v]
+                weights[-2:] = [w]
+        return np.repeat(values, weights)
+
+
+    def to_dbfs(self, spl):
+        """ Map dB SPL to dB FS. Takes a single value or an 
+            array of values.
+        """
+        spl = np.asarray(spl, dtype=float)
+        dbfs = np.interp(spl, self.spl, self.dbfs)
+        dbfs = np.where(spl < self.spl[0], spl - self.offset_low, dbfs)
+        dbfs = np.where(spl > self.spl[-1], spl - self.offset_high, dbfs)
+        return dbfs[()]
+
+
+    def to_spl(self, dbfs):
+        """ Map dB FS to dB SPL. Takes a single value or an 
+            array of values.
+        """
+        dbfs = np.asarray(dbfs, dtype=float)
+        spl = np.interp(dbfs, self.dbfs, self.spl)
+        spl = np.where(dbfs < self.dbfs[0], dbfs + self.offset_low, spl)
+        spl = np.where(dbfs > self.dbfs[-1], dbfs + self.offset_high, spl)
+        return spl[()]
+
+
+class DeviceProfileModel:
+    """ Persistent table of calibration offsets, keyed by
+        device name and output channel.
+    """
+    # Seconds a device name lookup (or a failed lookup) is reused
+    # before the device is queried again
+    NAME_TTL = 5.0
+
+    def __init__(self, filepath=None, station=None, query=None):
+        """ query: callable(device_id) returning the device name, 
+                raising sd.PortAudioError or ValueError for an 
+                unknown device (default: ask PortAudio)
+        """
+        self.query = query or self._query_device
+        # Store profiles file in user's home directory
+        # Stations (booths run from one host) each get their own,
+        # so they never overwrite each other's profiles
+        filename = 'moa_task_fly_profiles.json'
+        self.shared_filepath = Path.home() / filename
+        if station:
+            filename = f'moa_task_fly_profiles_{station}.json'
+        if filepath is None:
+            filepath = Path.home() / filename
+        self.filepath = Path(filepath)
+
+        # Route key -> calibration record
+        self.routes = {}
+
+        # Device name -> stream settings
+        self.devices = {}
+
+        # Route key -> fitted CalCurve
+        self._curves = {}
+
+        # Device id -> (device name, time looked up)
+        self._names = {}
+
+        # Load profiles file
+        self.load()
+
+
+    def load(self):
+        """ Load profiles from file
+        """
+        # If the file doesn't exist, abort
+        print("\nprofilemodel: Checking for profiles file...")
+        path = self.filepath
+        if not path.exists():
+            # A new station starts from the shared profiles
+            if self.filepath == self.shared_filepath or \
+                    not self.shared_filepath.exists():
+                return
+            path = self.shared_filepath
+
+        print(f"profilemodel: File found - reading profiles from {path}...")
+        with open(path, 'r') as fh:
+            raw_values = json.load(fh)
+        self.routes = dict(raw_values.get('routes', {}))
+        self.devices = dict(raw_values.get('devices', {}))
+        self._curves = {}
+
+
+    def save(self):
+        """ Save profiles to file
+        """
+        print("profilemodel: Writing profiles to file...")
+        # Write to a temp file and swap it in, so an interrupted
+        # write never leaves a truncated file behind
+        tmp = self.filepath.with_suffix('.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump({'routes': self.routes, 'devices': self.devices},
+                fh, indent=2)
+        os.replace(tmp, self.filepath)
+
+
+    @staticmethod
+    def _query_device(device_id):
+        return sd.query_devices(device_id)['name']
+
+
+    def device_name(self, device_id):
+        """ Look up the name of an audio device, or None if it 
+            cannot be found. Results, including failed lookups, 
+            are reused for NAME_TTL seconds, so a missing device 
+            is not queried on every call and a replugged one is 
+            picked up soon after.
+        """
+        now = time.monotonic()
+        try:
+            name, looked_up = self._names[device_id]
+            if now - looked_up < self.NAME_TTL:
+                return name
+        except KeyError:
+            pass
+
+        try:
+            name = self.query(device_id)
+        except (sd.PortAudioError, ValueError):
+            name = None
+        self._names[device_id] = (name, now)
+        return name
+
+
+    def _known_name(self, device_id):
+        """ Device name to store data under. Raises LookupError
+            if the device cannot be found: data stored under a 
+            placeholder would never match the device again.
+        """
+        name = self.device_name(device_id)
+        if name is None:
+            raise LookupError(
+                f"profilemodel: Cannot find audio device {device_id}")
+        return name
+
+
+    def route_key(self, device_id, channel):
+        """ Key for a device/channel pair (None if the device 
+            cannot be found)
+        """
+        name = self.device_name(device_id)
+        if name is None:
+            return None
+        return f"{name}|{channel}"
+
+
+    def get_route(self, device_id, channel):
+        """ Return the calibration record for a route, or None
+        """
+        return self.routes.get(self.route_key(device_id, channel))
+
+
+    def get_offset(self, device_id, channel, default=None):
+        """ Return the SLM offset for a route: the curve's dB SPL
+            at 0 dB FS, as used for presentation levels
+        """
+        curve = self.get_curve(device_id, channel)
+        if curve is None:
+            return default
+        return float(curve.to_spl(0.0))
+
+
+    def set_offset(self, device_id, channel, slm_offset):
+        """ Store a single SLM offset for a route, replacing any 
+            calibration points. Raises LookupError if the device
+            cannot be found.
+        """
+        self._known_name(device_id)
+        self.clear_route(device_id, channel)
+        self.add_point(device_id, channel, 0.0, slm_offset)
+
+
+    def add_point(self, device_id, channel, dbfs, spl):
+        """ Add an SLM reading (spl) taken at dbfs to a route. 
+            A reading at the same dB FS replaces the old one.
+            Raises LookupError if the device cannot be found.
+        """
+        name = self._known_name(device_id)
+        key = f"{name}|{channel}"
+        route = self.routes.get(key, {})
+        points = [p for p in self._points(route) if p[0] != dbfs]
+        points.append([dbfs, spl])
+        points.sort()
+        curve = CalCurve(points)
+        self.routes[key] = {
+            'device': name,
+            'channel': channel,
+            'slm_offset': float(curve.to_spl(0.0)),
+            'points': points,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+        }
+        self._curves[key] = curve
+
+
+    def clear_route(self, device_id, channel):
+        """ Remove all calibration data for a route
+        """
+        key = self.route_key(device_id, channel)
+        self.routes.pop(key, None)
+        self._curves.pop(key, None)
+
+
+    def get_curve(self, device_id, channel):
+        """ Return the fitted CalCurve for a route, or None. 
+            Curves are fit once and reused.
+        """
+        key = self.route_key(device_id, channel)
+        try:
+            return self._curves[key]
+        except KeyError:
+            pass
+        route = self.routes.get(key)
+        if route is None:
+            return None
+        curve = CalCurve(self._points(route))
+        self._curves[key] = curve
+        return curve
+
+
+    def get_stream_settings(self, device_id):
+        """ Return the tuned stream settings for a device, or None
+        """
+        return self.devices.get(self.device_name(device_id))
+
+
+    def set_stream_settings(self, device_id, settings):
+        """ Store stream settings (blocksize, latency, ...) for 
+            a device. Raises LookupError if the device cannot be 
+            found.
+        """
+        self.devices[self._known_name(device_id)] = {
+            **settings,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+        }
+
+
+    @staticmethod
+    def _points(route):
+        """ Calibration points of a route. Records with only 
+            an offset count as a single point.
+        """
+        if 'points' in route:
+            return [list(p) for p in route['points']]
+        if 'slm_offset' in route:
+            return [[0.0, route['slm_offset']]]
+        return []
@@ -0,0 +1,209 @@
+""" Opt-in real-time measures for presentations (Linux).
+
+    Before each presentation:
+      - garbage collection is run and then held off until the next
+        presentation, so it cannot stall the audio submission
+      - the stimulus buffer is locked in memory (mlock)
+      - the thread that opens the PortAudio stream is raised to
+        SCHED_FIFO (falling back to a lower nice value) and pinned
+        to a CPU. PortAudio's callback thread is created by that
+        call and inherits both; the Tk thread is put back right
+        after, so redraws never run at real-time priority.
+
+    The app calls release() when it quits, which turns collection
+    back on and unlocks the buffer, and prints report().
+
+    Each measure needs permissions (CAP_SYS_NICE or an rtprio
+    limit, and a memlock limit large enough for the stimuli). What
+    was and was not applied is reported, not raised.
+
+    Enable with:
+        python controller.py --realtime
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+from contextlib import contextmanager
+
+
+#########
+# MODEL #
+#########
+class RealtimeMode:
+    """ Apply real-time measures around each presentation
+    """
+    def __init__(self, priority=20, nice=-10, cpus=None, lock=True):
+        """ priority: SCHED_FIFO priority (1-99) for the audio thread
+            nice: fallback nice value when SCHED_FIFO is refused
+            cpus: CPUs to pin the audio thread to (default: the
+                last CPU this process may use)
+            lock: mlock stimulus buffers
+        """
+        self.priority = priority
+        self.nice = nice
+        self.cpus = cpus
+        self.lock = lock
+
+        # Measure -> 'ok' or the reason it was not applied
+        self.status = {}
+        self._reported = {}
+
+        self._libc = None
+        self._locked = None
+
+
+    ############
+    # Measures #
+    ############
+    def _gc(self):
+        """ Collect now and hold off collection until the next
+            presentation
+        """
+        gc.unfreeze()
+        gc.collect()
+        # Survivors are not rescanned by later collections
+        gc.freeze()
+        gc.disable()
+        return 'ok'
+
+
+    def _raise_priority(self):
+        """ Raise the calling thread's priority. Returns a function
+            that restores it.
+        """
+        try:
+            policy = os.sched_getscheduler(0)
+            param = os.sched_getparam(0)
+        except AttributeError:
+            self.status['scheduler'] = f"not supported on {sys.platform}"
+            return lambda: None
+
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO,
+                os.sched_param(self.priority))
+            self.status['scheduler'] = f"ok (SCHED_FIFO {self.priority})"
+            return lambda: os.sched_setscheduler(0, policy, param)
+        except PermissionError:
+            pass
+
+        # Fall back to nice (per thread on Linux)
+        old = os.getpriority(os.PRIO_PROCESS, 0)
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+        except PermissionError:
+            self.status['scheduler'] = "failed (no permission for " + \
+                "SCHED_FIFO or nice)"
+            return lambda: None
+        self.status['scheduler'] = f"fallback (nice {self.nice})"
+
+        def restore():
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, old)
+            except PermissionError:
+                # Lowering nice back up is always allowed, but be safe
+                pass
+        return restore
+
+
+    def _pin(self):
+        """ Pin the calling thread to self.cpus. Returns a function
+            that restores the old affinity.
+        """
+        try:
+            old = os.sched_getaffinity(0)
+        except AttributeError:
+            self.status['affinity'] = f"not supported on {sys.platform}"
+            return lambda: None
+
+        cpus = self.cpus or {max(old)}
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            self.status['affinity'] = f"failed ({e.strerror})"
+            return lambda: None
+        self.status['affinity'] = f"ok (CPU {sorted(cpus)})"
+        return lambda: os.sched_setaffinity(0, old)
+
+
+    def _mlock(self, buffer):
+        """ Lock buffer in memory and unlock the previous one
+        """
+        if not self.lock:
+            return
+        if self._libc is None:
+            name = ctypes.util.find_library('c')
+            if name is None or not hasattr(ctypes.CDLL(name), 'mlock'):
+                self.status['mlock'] = f"not supported on {sys.platform}"
+                return
+            self._libc = ctypes.CDLL(name, use_errno=True)
+            self._libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            self._libc.munlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+
+        self._munlock()
+        if self._libc.mlock(buffer.ctypes.data, buffer.nbytes) != 0:
+            err = ctypes.get_errno()
+            self.status['mlock'] = f"failed ({os.strerror(err)})"
+            return
+        # Keep a reference so the memory stays valid while locked
+        self._locked = buffer
+        self.status['mlock'] = f"ok ({buffer.nbytes / 2**20:.1f} MiB)"
+
+
+    def _munlock(self):
+        if self._locked is not None:
+            self._libc.munlock(self._locked.ctypes.data, self._locked.nbytes)
+            self._locked = None
+
+
+    ##############
+    # Public API #
+    ##############
+    @contextmanager
+    def presentation(self, buffer):
+        """ Wrap the call that opens the audio stream
+        """
+        self.status['gc'] = self._gc()
+        self._mlock(buffer)
+        restore_priority = self._raise_priority()
+        restore_affinity = self._pin()
+        try:
+            yield
+        finally:
+            restore_affinity()
+            restore_priority()
+            self._print_changes()
+
+
+    def release(self):
+        """ Undo lasting measures (GC, memory lock)
+        """
+        self._munlock()
+        gc.unfreeze()
+        gc.enable()
+
+
+    def report(self):
+        """ Lines describing what was applied
+        """
+        if not self.status:
+            return ["realtimemodel: No presentation yet"]
+        return [f"realtimemodel: {measure}: {result}"
+            for measure, result in self.status.items()]
+
+
+    def _print_changes(self):
+        """ Print measures whose result changed
+        """
+        for measure, result in self.status.items():
+            if self._reported.get(measure) != result:
+                print(f"realtimemodel: {measure}: {result}")
+        self._reported = dict(self.status)
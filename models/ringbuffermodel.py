@@ -0,0 +1,131 @@
+""" Single-producer/single-consumer ring buffer for audio.
+
+    Moves samples from a Python thread (the producer) into a
+    PortAudio callback (the consumer) without locks. The storage
+    is allocated once; write() and read_into() only copy slices.
+
+    The two sides never write the same field: the producer only
+    advances the write index and the consumer only advances the
+    read index. Samples are copied before an index is advanced,
+    so the other side never sees a half-written block.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import data science packages
+import numpy as np
+
+
+#########
+# MODEL #
+#########
+class RingBuffer:
+    """ Preallocated (frames, channels) ring buffer with overrun
+        and underrun counters and a gain slot
+    """
+    def __init__(self, capacity, channels=1, dtype=np.float32):
+        """ capacity: frames; rounded up to a power of two
+        """
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.capacity = size
+        self.channels = channels
+        self._mask = size - 1
+        self._data = np.zeros((size, channels), dtype=dtype)
+
+        # Total frames written/read; only ever increase
+        self._write = 0
+        self._read = 0
+
+        # Gain applied by the consumer (set from any thread)
+        self.gain = 1.0
+
+        # Producer side: writes that did not fit, frames dropped
+        self.overruns = 0
+        self.dropped_frames = 0
+        # Consumer side: reads that came up short, frames missing
+        self.underruns = 0
+        self.missing_frames = 0
+
+
+    @property
+    def readable(self):
+        """ Frames waiting to be read
+        """
+        return self._write - self._read
+
+
+    @property
+    def writable(self):
+        """ Frames that can be written without dropping any
+        """
+        return self.capacity - (self._write - self._read)
+
+
+    def write(self, data):
+        """ Producer: copy as much of data as fits. Returns the
+            number of frames written; the rest is dropped and
+            counted as an overrun.
+        """
+        data = data.reshape(len(data), -1)
+        frames = min(len(data), self.writable)
+        if frames < len(data):
+            self.overruns += 1
+            self.dropped_frames += len(data) - frames
+
+        start = self._write & self._mask
+        first = min(frames, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        self._data[:frames - first] = data[first:frames]
+
+        # Publish only after the samples are in place
+        self._write += frames
+        return frames
+
+
+    def read_into(self, out):
+        """ Consumer: fill out (frames, channels) with the next
+            samples at the current gain. Missing samples are
+            filled with silence and counted as an underrun.
+            Returns the number of frames read.
+        """
+        wanted = len(out)
+        frames = min(wanted, self._write - self._read)
+
+        start = self._read & self._mask
+        first = min(frames, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:frames] = self._data[:frames - first]
+        if frames < wanted:
+            out[frames:] = 0
+            self.underruns += 1
+            self.missing_frames += wanted - frames
+
+        gain = self.gain
+        if gain != 1.0:
+            np.multiply(out[:frames], gain, out=out[:frames])
+
+        # Free the space only after the samples are copied out
+        self._read += frames
+        return frames
+
+
+    def clear(self):
+        """ Consumer: drop everything waiting to be read
+        """
+        self._read = self._write
+
+
+    def stats(self):
+        """ Counters as a dict
+        """
+        return {
+            'overruns': self.overruns,
+            'dropped_frames': self.dropped_frames,
+            'underruns': self.underruns,
+            'missing_frames': self.missing_frames,
+        }
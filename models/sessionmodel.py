@@ -5,6 +5,8 @@
 # IMPORTS  #
 ############
 # Import system packages
+import copy
+import os
 from pathlib import Path
 
 # Import data handling packages
@@ -25,6 +27,7 @@ class SessionParsModel:
         # Stimulus variables
         'isi': {'type': 'float', 'value': 60.0},
         'jitter': {'type': 'float', 'value': 0.5},
+        'isi_mode': {'type': 'str', 'value': 'offset'},
         'train_reps': {'type': 'int', 'value': 10},
         'big_step': {'type': 'float', 'value': 5.0},
         'small_step': {'type': 'float', 'value': 2.5},
@@ -34,15 +37,27 @@ class SessionParsModel:
         'min_start': {'type': 'float', 'value': 50.0},
         'stim_file_path': {'type': 'str', 'value': 'Please select a .wav file'},
 
+        # Synthesized stimulus variables ('file': use stim_file_path)
+        'stim_source': {'type': 'str', 'value': 'file'},
+        'synth_fs': {'type': 'int', 'value': 48000},
+        'synth_dur': {'type': 'float', 'value': 5.0},
+        'synth_freq': {'type': 'float', 'value': 1000.0},
+        'synth_ramp': {'type': 'float', 'value': 1.0},
+        'click_dur': {'type': 'float', 'value': 0.1},
+
         # Audio device variables
         'audio_device': {'type': 'int', 'value': 999},
         'speaker_number': {'type': 'int', 'value': 1},
+        'presentation_preroll': {'type': 'float', 'value': 0.0},
+        'trigger_channel': {'type': 'int', 'value': 0},
+        'trigger_width': {'type': 'float', 'value': 1.0},
 
         # Calibration variables
         'cal_scaling_factor': {'type': 'float', 'value': -30.0},
         'slm_reading': {'type': 'float', 'value': 82.0},
         'slm_offset': {'type': 'float', 'value': 100.0},
         'cal_file': {'type': 'str', 'value': 'cal_stim.wav'},
+        'cal_loop': {'type': 'bool', 'value': False},
 
         # Presentation level variables
         'scaling_factor': {'type': 'float', 'value': -30.0},
@@ -54,9 +69,15 @@ class SessionParsModel:
     }
 
 
-    def __init__(self):
+    def __init__(self, station=None):
+        # Each instance gets its own copy of the defaults
+        self.fields = copy.deepcopy(SessionParsModel.fields)
+
         # Create session parameters file
+        # Stations (booths run from one host) each get their own
         filename = 'moa_task_fly.json'
+        if station:
+            filename = f'moa_task_fly_{station}.json'
 
         # Store settings file in user's home directory
         self.filepath = Path.home() / filename
@@ -94,8 +115,12 @@ class SessionParsModel:
         """
         # Write to JSON file
         print("sessionmodel: Writing session pars from model to file...")
-        with open(self.filepath, 'w') as fh:
+        # Write to a temp file and swap it in, so an interrupted
+        # write never leaves a truncated file behind
+        tmp = self.filepath.with_suffix('.tmp')
+        with open(tmp, 'w') as fh:
             json.dump(self.fields, fh)
+        os.replace(tmp, self.filepath)
 
 
     def set(self, key, value):
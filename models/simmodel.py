@@ -0,0 +1,316 @@
+""" Virtual-listener simulation for soak-testing the trial loop.
+
+    SimulationDriver presses the same buttons a listener would
+    (Start, arrow buttons, Submit) on a running Application, with
+    audio routed to a null sink. It records per-event latency,
+    resident memory, open file handles and Tk variable counts, so
+    leaks show up before a long clinic day.
+
+    The driver never uses the user's saved settings: it starts
+    from the default settings with a stimulus it writes to its
+    workdir. Message boxes raise SimulationError while it runs,
+    so an unattended run fails loudly instead of waiting forever
+    on a dialog.
+
+    Needs a display; on a headless Linux box use xvfb-run:
+        xvfb-run python controller.py --simulate 5000
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import csv
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# Import GUI packages
+from tkinter import messagebox
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+import soundfile as sf
+
+# Import custom modules
+from models import audiomodel
+from models import sessionmodel
+
+
+#########
+# MODEL #
+#########
+# Dialogs that would block an unattended run
+DIALOGS = ('showinfo', 'showwarning', 'showerror', 'askquestion',
+    'askokcancel', 'askyesno', 'askyesnocancel', 'askretrycancel')
+
+
+class SimulationError(RuntimeError):
+    """ A dialog was opened during a simulated session
+    """
+
+
+class NullSink:
+    """ Audio sink that drops buffers (counts them only)
+    """
+    def __init__(self):
+        self.buffers = 0
+        self.samples = 0
+
+
+    def __call__(self, buffer, fs, device_id, speaker):
+        self.buffers += 1
+        self.samples += len(buffer)
+
+
+class VirtualListener:
+    """ Decides which button to press next.
+
+        Stochastic: each trial draws a preferred level around
+        `preferred` (dB SPL) and steps towards it, with some
+        decision noise, until within half a small step.
+        Scripted: cycles through `script`, a list of button ids
+        (None means submit).
+    """
+    def __init__(self, preferred=65.0, spread=5.0, noise=1.0,
+                 max_presses=20, script=None, seed=None):
+        self.preferred = preferred
+        self.spread = spread
+        self.noise = noise
+        self.max_presses = max_presses
+        self.script = script
+        self._rng = random.Random(seed)
+        self._step = 0
+
+
+    def new_trial(self):
+        """ Draw the preferred level for a new trial
+        """
+        self.target = self._rng.gauss(self.preferred, self.spread)
+        self.presses = 0
+
+
+    def choose(self, db_level, big_step, small_step):
+        """ Return the next button id, or None to submit
+        """
+        if self.script is not None:
+            button = self.script[self._step % len(self.script)]
+            self._step += 1
+            return button
+
+        self.presses += 1
+        if self.presses > self.max_presses:
+            return None
+        diff = self.target - db_level + self._rng.gauss(0, self.noise)
+        if abs(diff) < small_step / 2:
+            return None
+        size = 'big' if abs(diff) >= big_step else 'small'
+        return size + ('up' if diff > 0 else 'down')
+
+
+def write_stimulus(path, fs=48000):
+    """ Write a 5 ms, 1 kHz tone pip (-6 dB FS peak) to path
+    """
+    t = np.arange(int(fs * 0.005)) / fs
+    pip = 0.5 * np.sin(2 * np.pi * 1000 * t) * np.hanning(len(t))
+    sf.write(path, pip, fs)
+    return path
+
+
+def rss_bytes():
+    """ Resident memory of this process, or None if unknown
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak, not current, but better than nothing
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+def open_files():
+    """ Number of open file handles, or None if unknown
+    """
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+class SimulationDriver:
+    """ Run trials on an Application with a virtual listener
+    """
+    # Events timed by the driver
+    EVENTS = ('start', 'arrow', 'save')
+
+    def __init__(self, app, listener, trials=1000, workdir='.',
+                 report=None, sample_every=10):
+        self.app = app
+        self.listener = listener
+        self.trials = trials
+        self.workdir = Path(workdir).resolve()
+        self.report = report
+        self.sample_every = sample_every
+
+        self.latency = {event: [] for event in self.EVENTS}
+        self.samples = []
+        self.errors = 0
+
+
+    def _count_error(self, *args):
+        """ Count exceptions raised inside Tk callbacks
+        """
+        self.errors += 1
+        self.app.__class__.report_callback_exception(self.app, *args)
+
+
+    def _no_dialog(self, name):
+        """ Stand-in for a message box: raise instead of waiting
+            for a click that never comes
+        """
+        def dialog(*args, **kwargs):
+            raise SimulationError(f"{name} dialog during simulation: " +
+                f"{kwargs.get('title')}: {kwargs.get('message')} " +
+                f"{kwargs.get('detail') or ''}")
+        return dialog
+
+
+    def _use_sim_settings(self):
+        """ Replace the settings the app loaded with the defaults
+            and a stimulus generated in the workdir
+        """
+        for key, data in sessionmodel.SessionParsModel.fields.items():
+            self.app.sessionpars[key].set(data['value'])
+
+        stim_path = write_stimulus(self.workdir / 'sim_stim.wav')
+        self.app.sessionpars['stim_source'].set('file')
+        self.app.sessionpars['stim_file_path'].set(str(stim_path))
+        self.app.sessionpars['check_for_updates'].set('no')
+        # Never reach the end-of-task dialog
+        self.app.sessionpars['num_trials'].set(self.trials + 1)
+
+
+    def _timed(self, event, func):
+        start = time.perf_counter()
+        func()
+        self.latency[event].append(time.perf_counter() - start)
+
+
+    def _sample(self, trial):
+        self.samples.append({
+            'trial': trial,
+            'rss_bytes': rss_bytes(),
+            'open_files': open_files(),
+            'tk_globals': len(self.app.tk.call('info', 'globals')),
+            'buffers': self.sink.buffers,
+            'errors': self.errors,
+        })
+
+
+    def run(self):
+        """ Run all trials, then print and write the report
+        """
+        app = self.app
+        frame = app.main_frame
+        buttons = {
+            'bigup': frame._big_up,
+            'smallup': frame._small_up,
+            'bigdown': frame._big_down,
+            'smalldown': frame._small_down,
+        }
+
+        # Keep settings and data files out of the user's folders
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self._use_sim_settings()
+        old_settings = app.sessionpars_model.filepath
+        app.sessionpars_model.filepath = self.workdir / 'moa_task_fly.json'
+        old_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        print(f"simmodel: Writing settings and data to {self.workdir}")
+
+        self.sink = NullSink()
+        old_sink = audiomodel.Audio.sink
+        audiomodel.Audio.sink = self.sink
+        app.report_callback_exception = self._count_error
+        old_dialogs = {name: getattr(messagebox, name) for name in DIALOGS}
+        for name in DIALOGS:
+            setattr(messagebox, name, self._no_dialog(name))
+        print(f"\nsimmodel: Running {self.trials} simulated trials...")
+        try:
+            self._sample(0)
+            for trial in range(1, self.trials + 1):
+                self.listener.new_trial()
+                # Start button
+                self._timed('start', frame._repeat)
+                while True:
+                    button = self.listener.choose(
+                        app.sessionpars['db_level'].get(),
+                        app.sessionpars['big_step'].get(),
+                        app.sessionpars['small_step'].get()
+                    )
+                    if button is None:
+                        break
+                    self._timed('arrow', buttons[button])
+                # Submit button
+                self._timed('save', frame._on_submit)
+                # Let pending after() callbacks run
+                app.update()
+                if trial % self.sample_every == 0:
+                    self._sample(trial)
+        finally:
+            audiomodel.Audio.sink = old_sink
+            for name, dialog in old_dialogs.items():
+                setattr(messagebox, name, dialog)
+            del app.report_callback_exception
+            app.sessionpars_model.filepath = old_settings
+            os.chdir(old_cwd)
+        self._summarize()
+
+
+    def _summarize(self):
+        """ Print latency and growth summary, write samples
+        """
+        print("\nsimmodel: Event latency (ms)")
+        for event, values in self.latency.items():
+            if not values:
+                continue
+            ms = np.asarray(values) * 1000
+            print(f"simmodel:   {event:<6} n={len(ms):<7} " +
+                f"p50={np.percentile(ms, 50):.2f} " +
+                f"p95={np.percentile(ms, 95):.2f} max={ms.max():.2f}")
+
+        first, last = self.samples[0], self.samples[-1]
+        print(f"simmodel: Errors in callbacks: {self.errors}")
+        print(f"simmodel: Buffers presented: {self.sink.buffers}")
+        for key in ('rss_bytes', 'open_files', 'tk_globals'):
+            if first[key] is None:
+                continue
+            trials = [s['trial'] for s in self.samples]
+            values = [s[key] for s in self.samples]
+            slope = np.polyfit(trials, values, 1)[0] if len(values) > 1 \
+                else 0.0
+            flag = '  <-- growing' if last[key] > first[key] and \
+                slope > 0 else ''
+            print(f"simmodel: {key}: {first[key]} -> {last[key]} " +
+                f"({slope:+.2f} per trial){flag}")
+
+        if self.report:
+            with open(self.report, 'w', newline='') as fh:
+                csvwriter = csv.DictWriter(fh,
+                    fieldnames=self.samples[0].keys())
+                csvwriter.writeheader()
+                csvwriter.writerows(self.samples)
+            print(f"simmodel: Samples written to {self.report}")
@@ -0,0 +1,164 @@
+""" Shared, read-only decoded stimuli for multi-station runs.
+
+    Several stations (booths) can run from one host, one process
+    per station. Each .wav file is decoded once into a named
+    shared memory block; every station maps the same block
+    read-only instead of decoding its own copy.
+
+    Blocks are named from the file's path, size and modification
+    time, so an edited file gets a new block. A small header
+    holds a ready flag: the first process to create a block
+    decodes into it and then sets the flag, others wait for it.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import hashlib
+import os
+import time
+from multiprocessing import shared_memory
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+import soundfile as sf
+
+# Import custom modules
+from models.enginemodel import _attach_shared
+
+
+#########
+# MODEL #
+#########
+class StimulusStore:
+    """ Decoded .wav files in shared memory
+    """
+    # Header: magic, ready, fs, frames, channels (int64 each)
+    MAGIC = 0x4D4F4153544D  # "MOASTM"
+    HEADER = 64
+    DTYPE = np.float64  # what sf.read returns by default
+
+    def __init__(self, timeout=10.0):
+        """ timeout: seconds to wait for another process to finish
+                decoding a block
+        """
+        self.timeout = timeout
+        # Block name -> (SharedMemory, array, fs, owned)
+        self._blocks = {}
+
+
+    @staticmethod
+    def block_name(file_path):
+        """ Shared memory name for the current version of a file
+        """
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+        key = f"{path}|{st.st_size}|{st.st_mtime_ns}".encode()
+        # Short names: macOS allows 31 characters
+        return "moa_" + hashlib.sha1(key).hexdigest()[:16]
+
+
+    def load(self, file_path):
+        """ Return (signal, fs) for file_path. The signal is a
+            read-only view of the shared block.
+        """
+        name = self.block_name(file_path)
+        if name not in self._blocks:
+            try:
+                self._blocks[name] = self._create(name, file_path)
+            except FileExistsError:
+                self._blocks[name] = self._attach(name, file_path)
+        shm, array, fs, owned = self._blocks[name]
+        return array, fs
+
+
+    @staticmethod
+    def _header(shm):
+        return np.ndarray((5,), dtype=np.int64, buffer=shm.buf)
+
+
+    def _create(self, name, file_path):
+        """ Create a block and decode file_path into it
+        """
+        info = sf.info(file_path)
+        frames, channels = info.frames, info.channels
+        size = self.HEADER + frames * channels * np.dtype(self.DTYPE).itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        print(f"stationmodel: Decoding {os.path.basename(file_path)} " +
+            "into shared memory")
+
+        header = self._header(shm)
+        header[:] = [self.MAGIC, 0, info.samplerate, frames, channels]
+        shape = (frames,) if channels == 1 else (frames, channels)
+        array = np.ndarray(shape, dtype=self.DTYPE, buffer=shm.buf,
+            offset=self.HEADER)
+        try:
+            sf.read(file_path, out=array.reshape(frames, -1)
+                if channels > 1 else array)
+        except Exception:
+            del header, array
+            shm.close()
+            shm.unlink()
+            raise
+        # Published: readers may use it now
+        header[1] = 1
+        array.flags.writeable = False
+        return shm, array, info.samplerate, True
+
+
+    def _attach(self, name, file_path):
+        """ Map a block made by another process, waiting until it
+            is ready
+        """
+        shm = _attach_shared(name)
+        header = self._header(shm)
+        deadline = time.monotonic() + self.timeout
+        while header[0] != self.MAGIC or header[1] != 1:
+            if time.monotonic() > deadline:
+                del header
+                shm.close()
+                raise TimeoutError("stationmodel: Shared copy of " +
+                    f"{os.path.basename(file_path)} never became ready")
+            time.sleep(0.005)
+
+        magic, ready, fs, frames, channels = (int(v) for v in header)
+        shape = (frames,) if channels == 1 else (frames, channels)
+        array = np.ndarray(shape, dtype=self.DTYPE, buffer=shm.buf,
+            offset=self.HEADER)
+        array.flags.writeable = False
+        print(f"stationmodel: Using shared copy of " +
+            f"{os.path.basename(file_path)}")
+        return shm, array, fs, False
+
+
+    def preload(self, paths):
+        """ Decode files ahead of time (skips missing files)
+        """
+        for path in paths:
+            if os.access(path, os.F_OK):
+                try:
+                    self.load(path)
+                except (RuntimeError, TimeoutError) as e:
+                    print(f"stationmodel: Cannot preload {path}: {e}")
+
+
+    def close(self):
+        """ Unmap all blocks and remove the ones this process made.
+            Stations that still map a block keep their copy.
+        """
+        blocks = list(self._blocks.values())
+        self._blocks.clear()
+        for shm, array, fs, owned in blocks:
+            del array
+            try:
+                shm.close()
+            except BufferError:
+                # Still in use here; unmapped when the process exits
+                pass
+            if owned:
+                shm.unlink()
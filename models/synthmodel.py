@@ -0,0 +1,123 @@
+""" Procedural tick stimuli: clicks, tone pips and noise bursts.
+
+    Kernels are synthesized from their parameters instead of read
+    from a .wav file, so a new tick variant needs no file on disk.
+    Each kernel is cached by its parameter tuple; the cached arrays
+    are read-only, and TickModel/Audio only ever copy them.
+
+    Onsets and offsets use raised-cosine (cos^2) ramps. Clicks are
+    unramped rectangular pulses.
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+from functools import lru_cache
+
+# Import data science packages
+import numpy as np
+
+# Import custom modules
+from models import audiomodel
+
+
+#########
+# MODEL #
+#########
+def _samples(fs, ms):
+    """ Duration in ms to a whole number of samples (at least 1)
+    """
+    return max(1, int(round(ms / 1000 * fs)))
+
+
+def _frozen(x):
+    """ Mark a cached kernel read-only
+    """
+    x.flags.writeable = False
+    return x
+
+
+@lru_cache(maxsize=None)
+def ramp(n):
+    """ Rising cos^2 ramp of n samples
+    """
+    return _frozen(np.sin(np.pi / 2 * np.arange(n) / n) ** 2)
+
+
+def _apply_ramps(sig, fs, ramp_ms):
+    """ Apply onset/offset ramps in place
+    """
+    n = min(_samples(fs, ramp_ms), len(sig) // 2) if ramp_ms > 0 else 0
+    if n:
+        sig[:n] *= ramp(n)
+        sig[-n:] *= ramp(n)[::-1]
+    return sig
+
+
+@lru_cache(maxsize=64)
+def click(fs, dur=0.1, polarity=1):
+    """ Rectangular click
+        dur: pulse length (ms)
+        polarity: 1 (condensation) or -1 (rarefaction)
+    """
+    return _frozen(np.full(_samples(fs, dur), float(polarity)))
+
+
+@lru_cache(maxsize=64)
+def tone_pip(fs, freq=1000.0, dur=5.0, ramp_ms=1.0):
+    """ Ramped sinusoid
+        freq: frequency (Hz)
+        dur: total length including ramps (ms)
+    """
+    t = np.arange(_samples(fs, dur)) / fs
+    sig = np.sin(2 * np.pi * freq * t)
+    return _frozen(_apply_ramps(sig, fs, ramp_ms))
+
+
+@lru_cache(maxsize=64)
+def noise_burst(fs, dur=5.0, ramp_ms=1.0, seed=0):
+    """ Ramped Gaussian noise, peak normalized. The same seed gives
+        the same (frozen) noise on every call.
+    """
+    sig = np.random.default_rng(seed).standard_normal(_samples(fs, dur))
+    sig /= np.max(np.abs(sig))
+    return _frozen(_apply_ramps(sig, fs, ramp_ms))
+
+
+class SynthModel:
+    """ Build the tick kernel named by sessionpars['stim_source']
+    """
+    SOURCES = ('click', 'tone_pip', 'noise')
+
+    def __init__(self, sessionpars):
+        self.sessionpars = sessionpars
+
+
+    def make_kernel(self):
+        """ Return (kernel, fs) for the current settings
+        """
+        source = self.sessionpars['stim_source'].get()
+        fs = self.sessionpars['synth_fs'].get()
+        dur = self.sessionpars['synth_dur'].get()
+        ramp_ms = self.sessionpars['synth_ramp'].get()
+
+        if source == 'click':
+            click_dur = self.sessionpars['click_dur'].get()
+            return click(fs, click_dur), fs
+        if source == 'tone_pip':
+            freq = self.sessionpars['synth_freq'].get()
+            return tone_pip(fs, freq, dur, ramp_ms), fs
+        if source == 'noise':
+            return noise_burst(fs, dur, ramp_ms), fs
+        raise ValueError(f"synthmodel: Unknown stimulus source: {source}")
+
+
+    def make_audio(self):
+        """ Audio object holding the kernel (in place of a file)
+        """
+        kernel, fs = self.make_kernel()
+        name = f"{self.sessionpars['stim_source'].get()}.wav"
+        return audiomodel.Audio.from_array(kernel, fs, name)
@@ -6,7 +6,6 @@
 ###########
 # Import data science packages
 import numpy as np
-import pandas as pd
 import random
 
 
@@ -23,40 +22,85 @@ class TickModel:
         self.audio = audio
         self.isi = self.sessionpars['isi'].get() / 1000
         self.jitter = self.sessionpars['jitter'].get() / 1000
+        self.isi_mode = self.sessionpars['isi_mode'].get()
 
+        # Offset mode: jitter draws accumulate (see _isi_in_samples)
+        self._walk = self.isi
 
-    def _isi_in_samples(self):
-        # Create silence
-        self.isi = self.isi + random.uniform(-self.jitter, self.jitter)
-        jittered_isi = self.isi * self.audio.fs
+        if self.isi_mode == 'onset':
+            # Every jittered onset-to-onset interval must be positive
+            if self.isi <= 0 or self.jitter < 0 or self.jitter >= self.isi:
+                raise ValueError("tickmodel: In onset mode, ISI must be " +
+                    "greater than 0 and jitter must be between 0 and the ISI")
+        elif self.isi < 0 or self.jitter < 0:
+            # Gaps may be 0 (back-to-back ticks)
+            raise ValueError("tickmodel: ISI and jitter cannot be negative")
 
-        return jittered_isi
 
+    def _isi_in_samples(self):
+        if self.isi_mode == 'onset':
+            # Jitter around the nominal ISI (does not accumulate)
+            return (self.isi + random.uniform(-self.jitter, self.jitter)) \
+                * self.audio.fs
+
+        # Offset mode keeps the original draw: each jitter is added
+        # to the previous ISI, so trains match earlier versions
+        # sample for sample for the same seed. Negative gaps are
+        # clamped to 0 in _onsets.
+        self._walk = self._walk + random.uniform(-self.jitter, self.jitter)
+        jittered_isi = self._walk * self.audio.fs
 
-    def _single_tick(self):
-        # Get number of samples for isi + jitter
-        samps = self._isi_in_samples()
+        return jittered_isi
 
-        # Mono signal
-        shh = np.zeros(int(samps))
-        
-        # Stereo signal
-        #if self.audio.num_channels == 2:
-        #    shh = np.array([shh,shh])
 
-        # Signal + silence
-        singleton = np.hstack([self.audio.signal, shh])
+    def _onsets(self):
+        """ Onset (sample index) of every tick and the length of 
+            the train. The ISI is measured from the end of the 
+            previous tick ('offset') or from its onset ('onset'), 
+            which allows ISIs shorter than the tick.
+        """
+        reps = self.sessionpars['train_reps'].get()
+        tick = len(self.audio.signal)
+        # One jittered ISI per tick
+        isis = np.array([int(self._isi_in_samples()) for _ in range(reps)],
+            dtype=int)
 
-        return singleton
+        if self.isi_mode == 'onset':
+            # Never two ticks on the same sample
+            steps = np.maximum(isis, 1)
+            length = max(steps.sum(), steps[:-1].sum() + tick) if reps else 0
+        else:
+            isis = np.maximum(isis, 0)
+            steps = isis + tick
+            length = steps.sum()
+        onsets = np.concatenate([[0], np.cumsum(steps)[:-1]]) if reps \
+            else np.zeros(0, dtype=int)
+        return onsets, int(length)
 
 
     def make_train(self):
-        train = []
-        for ii in range(0, self.sessionpars['train_reps'].get()):
-            # Get a single tick plus randomly jittered isi
-            singleton = self._single_tick()
-            #train = np.hstack((justone,) * self.sessionpars['train_reps'])
-            train.append(singleton)
-
-        self.tick_train = np.hstack(train)
+        """ Overlap-add each tick at its onset. Overlapping ticks 
+            are summed.
+        """
+        self.onsets, length = self._onsets()
+        tick = np.asarray(self.audio.signal)
+
+        # Output index of every tick sample, then one accumulation
+        idx = (self.onsets[:, None] + np.arange(len(tick))).ravel()
+        weights = np.tile(tick, len(self.onsets))
+        self.tick_train = np.bincount(idx, weights=weights,
+            minlength=length).astype(np.float64, copy=False)
         return self.tick_train
+
+
+    def make_marker(self, width=1.0, amplitude=0.9):
+        """ Marker channel for the last train: a pulse at every 
+            tick onset (TTL-style, for EEG/physiology triggers).
+            width: pulse length (ms)
+            amplitude: pulse height (full scale = 1)
+        """
+        marker = np.zeros(len(self.tick_train))
+        samps = max(1, int(round(width / 1000 * self.audio.fs)))
+        for onset in self.onsets:
+            marker[onset:onset + samps] = amplitude
+        return marker
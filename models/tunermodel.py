@@ -0,0 +1,206 @@
+""" Blocksize/latency tuning for an output device.
+
+    Opens the device with each combination of blocksize and
+    suggested latency, plays silence for a few seconds and counts
+    output underflows and late callbacks. The setting with the
+    lowest reported output latency that ran clean is stored in
+    the device's profile, with the sampling rate and channel count
+    it was found at. Playback uses it automatically at that rate,
+    for streams with no more channels.
+
+    From the app: Tools > Tune Audio Device...
+    From the command line (project folder):
+        python -m models.tunermodel --device 3
+
+    Written by: Travis M. Moore
+"""
+
+############
+# IMPORTS  #
+############
+# Import system packages
+import argparse
+import threading
+import time
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+from functions.portaudio import sd
+
+# Import custom modules
+from models import profilemodel
+
+
+#########
+# MODEL #
+#########
+class StreamTuner:
+    """ Sweep blocksize and suggested latency on one device
+    """
+    POLL_MS = 100
+
+    # 0 lets PortAudio pick (what sd.play uses)
+    BLOCKSIZES = (0, 64, 128, 256, 512, 1024)
+    LATENCIES = ('low', 0.005, 0.01, 0.02, 0.05, 'high')
+
+    def __init__(self, device_id, fs=None, channels=None, duration=2.0,
+                 blocksizes=BLOCKSIZES, latencies=LATENCIES):
+        """ fs: sampling rate (default: the device's)
+            channels: output channels (default: all of the device's,
+                so the result holds for any routing)
+            duration: seconds each setting is run for
+            Raises sd.PortAudioError (or ValueError) for an invalid 
+            device.
+        """
+        self.device_id = device_id
+        if fs is None or channels is None:
+            info = sd.query_devices(device_id)
+            fs = fs or int(info['default_samplerate'])
+            channels = channels or info['max_output_channels']
+        self.fs = fs
+        self.channels = channels
+        self.duration = duration
+        self.blocksizes = blocksizes
+        self.latencies = latencies
+        self.results = []
+
+
+    def measure(self, blocksize, latency):
+        """ Run silence with one setting. Returns a result dict.
+        """
+        counts = {'callbacks': 0, 'underflows': 0, 'late': 0}
+
+        def callback(outdata, frames, time_info, status):
+            counts['callbacks'] += 1
+            if status.output_underflow:
+                counts['underflows'] += 1
+            if time_info.outputBufferDacTime and \
+                    time_info.currentTime > time_info.outputBufferDacTime:
+                counts['late'] += 1
+            outdata.fill(0)
+
+        result = {
+            'blocksize': blocksize,
+            'latency': latency,
+            'output_latency': None,
+            'error': None,
+        }
+        try:
+            with sd.OutputStream(samplerate=self.fs, device=self.device_id,
+                    channels=self.channels, dtype='float32',
+                    blocksize=blocksize, latency=latency,
+                    callback=callback) as stream:
+                time.sleep(self.duration)
+                result['output_latency'] = stream.latency
+        except (sd.PortAudioError, ValueError) as e:
+            result['error'] = str(e)
+        result.update(counts)
+        result['stable'] = result['error'] is None and \
+            counts['callbacks'] > 0 and \
+            counts['underflows'] == 0 and counts['late'] == 0
+        return result
+
+
+    def sweep(self, progress=None):
+        """ Measure every setting. progress(done, total) is called
+            after each one. Returns the best result or None.
+        """
+        settings = [(b, l) for b in self.blocksizes for l in self.latencies]
+        self.results = []
+        for done, (blocksize, latency) in enumerate(settings, 1):
+            result = self.measure(blocksize, latency)
+            self.results.append(result)
+            print(f"tunermodel: blocksize {blocksize:>5}, latency " +
+                f"{latency!s:>5}: " + (f"error ({result['error']})"
+                if result['error'] else
+                f"{result['output_latency'] * 1000:.1f} ms, " +
+                f"{result['underflows']} underflows, {result['late']} late"))
+            if progress is not None:
+                progress(done, len(settings))
+        return self.best()
+
+
+    def best(self):
+        """ Stable result with the lowest output latency (then the
+            smallest blocksize)
+        """
+        stable = [r for r in self.results if r['stable']]
+        if not stable:
+            return None
+        return min(stable, key=lambda r: (r['output_latency'],
+            r['blocksize'] or np.inf))
+
+
+    def save(self, profiles, result):
+        """ Store result as the device's stream settings
+        """
+        profiles.set_stream_settings(self.device_id, {
+            'blocksize': result['blocksize'],
+            'latency': result['latency'],
+            'output_latency': result['output_latency'],
+            'fs': self.fs,
+            'channels': self.channels,
+        })
+        profiles.save()
+
+
+    def sweep_async(self, root, callback):
+        """ Sweep on a background thread. callback(best, error) is
+            called on the Tk thread via root.after().
+        """
+        result = {}
+
+        def work():
+            try:
+                result['best'] = self.sweep()
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+
+        def poll():
+            if thread.is_alive():
+                root.after(self.POLL_MS, poll)
+                return
+            callback(result.get('best'), result.get('error'))
+
+        root.after(self.POLL_MS, poll)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find the lowest stable blocksize/latency for an " +
+            "output device and store it in the device profile.")
+    parser.add_argument('--device', type=int, required=True)
+    parser.add_argument('--fs', type=int, default=None,
+        help="sampling rate (default: the device's)")
+    parser.add_argument('--channels', type=int, default=None,
+        help="output channels (default: all of the device's)")
+    parser.add_argument('--duration', type=float, default=2.0,
+        help="seconds per setting")
+    parser.add_argument('--station', default=None,
+        help="store in this station's profiles (multi-station hosts)")
+    parser.add_argument('--dry-run', action='store_true',
+        help="do not write the profile")
+    args = parser.parse_args(argv)
+
+    tuner = StreamTuner(args.device, fs=args.fs, channels=args.channels,
+        duration=args.duration)
+    best = tuner.sweep()
+    if best is None:
+        print("\ntunermodel: No stable setting found")
+        return 1
+    print(f"\ntunermodel: Best: blocksize {best['blocksize']}, latency " +
+        f"{best['latency']} ({best['output_latency'] * 1000:.1f} ms)")
+    if not args.dry_run:
+        profiles = profilemodel.DeviceProfileModel(station=args.station)
+        tuner.save(profiles, best)
+        print(f"tunermodel: Saved to {profiles.filepath}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,6 +3,12 @@
     a message. If upgrade is mandatory, show warning and 
     kill app. 
 
+    The version library is read on a background thread so the
+    main window is not held up by a slow or unreachable file
+    server. The result is delivered on the Tk thread via after().
+    A local copy of the library is kept in the user's home
+    directory and used when the server does not respond in time.
+
     Written by: Travis M. Moore
     Created: Apr 11, 2023
     Last Edited: Apr 11, 2023
@@ -11,8 +17,15 @@
 ###########
 # Imports #
 ###########
-# Data science
-import pandas as pd
+# System
+import csv
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
 
 # GUI
 from tkinter import messagebox
@@ -21,76 +34,207 @@ from tkinter import messagebox
 #########
 # BEGIN #
 #########
+# Columns every version library must have
+_COLUMNS = ('name', 'version', 'mandatory')
+
+
+def _version_key(version):
+    """ Normalise a version for comparison: surrounding space and
+        a leading 'v' are ignored, numeric parts compare as 
+        numbers and trailing zero parts are dropped. So 'v1.0' 
+        and '1.0.0' are the same version, but 1.9 and 1.10 are 
+        not.
+    """
+    parts = str(version).strip().lstrip('vV').split('.')
+    parts = [int(p) if p.isdigit() else p for p in parts]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
 class VersionChecker:
     """ Class to check current version number against latest version 
         library on Starfile. If upgrade is available but not mandatory,
         return TRUE and display a message. If upgrade is mandatory, 
         return FALSE, display a message, and kill app. 
     """
-    def __init__(self, lib_path, app_name, app_version):
+    # Interval between checks on the background read (ms)
+    POLL_MS = 100
+
+    def __init__(self, lib_path, app_name, app_version, timeout=5.0,
+                 cache_ttl=24*60*60):
         self.lib_path = lib_path
         self.app_name = app_name
         self.app_version = app_version
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
         self.current = None
 
-        # Import version library to cross-reference
+        # Local copy of the version library
+        self.cache_path = Path.home() / 'version_library_cache.csv'
+
+        # Background read: the worker only ever puts its result
+        # here; the Tk thread alone sets the checker's state
+        self._thread = None
+        self._results = queue.Queue()
+
+
+    def start(self, root, callback):
+        """ Read the version library on a background thread.
+            callback(current) is called on the Tk thread once
+            the check has finished or timed out.
+        """
+        self._root = root
+        self._callback = callback
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._fetch, daemon=True)
+        self._thread.start()
+        self._root.after(self.POLL_MS, self._poll)
+
+
+    def _fetch(self):
+        """ Copy the version library to the local cache and
+            load it. Runs on the background thread.
+        """
         try:
-            self.import_version_library(self.lib_path)
+            # Each process copies to its own temp file, so stations
+            # starting together never write to the same file; the
+            # last complete copy to be swapped in wins
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_path.parent,
+                prefix=self.cache_path.stem + '.', suffix='.tmp')
+            os.close(fd)
+            try:
+                shutil.copyfile(self.lib_path, tmp_path)
+                os.replace(tmp_path, self.cache_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            self._results.put((self._read_record(self.cache_path), None))
+        except Exception as e:
+            # Hand any failure back to the Tk thread
+            self._results.put((None, e))
+
+
+    def _poll(self):
+        """ Wait for the background read, then check the version
+            on the Tk thread.
+        """
+        try:
+            record, error = self._results.get_nowait()
+        except queue.Empty:
+            if time.monotonic() - self._started < self.timeout:
+                self._root.after(self.POLL_MS, self._poll)
+                return
+            # The thread cannot be killed, but it is a daemon and
+            # its result is never read from here on
+            print("updater: Version library timed out!")
+            self._use_cache()
+        else:
+            if error is not None:
+                print(f"updater: Could not read from version library: " +
+                    f"{error}")
+                self._use_cache()
+            else:
+                self.app_record = record
+                self.check_for_updates()
+
+        self._callback(self.current)
+
+
+    def _use_cache(self):
+        """ Fall back on the local copy of the version library
+            if it is younger than the TTL.
+        """
+        try:
+            age = time.time() - os.path.getmtime(self.cache_path)
+            if age > self.cache_ttl:
+                raise FileNotFoundError
+            print(f"updater: Using cached version library " +
+                f"({int(age/60)} minutes old)")
+            self.import_version_library(self.cache_path)
         except FileNotFoundError:
-            print(f"updater: Could not read from version library!")
-            messagebox.showwarning(
-                title="Cannot Reach Library",
-                message="Cannot check for updates!",
-                detail="The version library is unreachable. Please check " +
-                "that you have access to Starfile and try again."
-            )
-            # Return True if version library file is unreachable. Defaults 
-            # to being able to use the app if it cannot check the server.
-            self.current = True
+            self._no_library("No recent cached version library!")
+            return
+        except (KeyError, ValueError, csv.Error) as e:
+            # Malformed header, bad encoding or broken quoting
+            self._no_library(f"Cannot read cached version library: {e!r}")
             return
 
         # Check version number
         self.check_for_updates()
 
 
+    def _no_library(self, reason):
+        """ No usable version library: warn and carry on.
+        """
+        print(f"updater: {reason}")
+        messagebox.showwarning(
+            title="Cannot Reach Library",
+            message="Cannot check for updates!",
+            detail="The version library is unreachable. Please check " +
+            "that you have access to Starfile and try again."
+        )
+        # Return True if version library file is unreachable. Defaults 
+        # to being able to use the app if it cannot check the server.
+        self.current = True
+
+
     def import_version_library(self, lib_path):
-        """ Load version library
+        """ Load the record for this app from the version library.
         """
-        # Download version library for crossreferencing
-        try:
-            self.version_library = pd.read_csv(lib_path)
-        except FileNotFoundError:
-            raise FileNotFoundError
-            
+        self.app_record = self._read_record(lib_path)
+
+
+    def _read_record(self, lib_path):
+        """ Return the record for this app, or None. Reads the
+            csv a row at a time and stops at the first row for 
+            this app. Cells are kept as strings. Raises KeyError
+            if the header lacks a required column. Safe to call 
+            from the background thread: sets no state.
+        """
+        with open(lib_path, 'r', newline='', encoding='utf-8-sig') as fh:
+            reader = csv.DictReader(fh)
+            header = reader.fieldnames or []
+            for column in _COLUMNS:
+                if column not in header:
+                    raise KeyError(column)
+            for row in reader:
+                if row['name'].strip() == self.app_name:
+                    return {key: (row[key] or '').strip() for key in header}
+        return None
+
 
     def check_for_updates(self):
         """ Check app version against latest available version from library.
         """
         # Retrieve app record from library 
-        bools = self.version_library['name']==self.app_name
-        status = self.version_library[bools]
+        status = self.app_record
 
         # Check whether current version matches version library
         try:
-            if status.iloc[0]['version'] != self.app_version:
+            if status is None:
+                raise IndexError
+            if _version_key(status['version']) != \
+                    _version_key(self.app_version):
                 print('\nupdater: New version available!')
                 print(f"updater: You are using version {self.app_version}, but " +
-                    f"version {status.iloc[0]['version']} is available.")
-                if status.iloc[0]['mandatory'] == 'yes':
+                    f"version {status['version']} is available.")
+                mandatory = status['mandatory'].lower()
+                if mandatory == 'yes':
                     messagebox.showerror(
                         title="New Version Available",
                         message=f"Mandatory software update required!",
                         detail=f"You must download version " +
-                        f"{status.iloc[0]['version']} to continue."
+                        f"{status['version']} to continue."
                     )
                     self.current = False
                     return
-                elif status.iloc[0]['mandatory'] == 'no':
+                elif mandatory == 'no':
                     messagebox.showwarning(
                         title="New Version Available",
                         message=f"Software update available!",
                         detail=f"Please download {self.app_name} " + 
-                        f"version {status.iloc[0]['version']}."
+                        f"version {status['version']}."
                     )
                 self.current = True
                 return
@@ -0,0 +1,50 @@
+""" Smoke test for scripted calibration runs: the loopback mode is
+    for unattended and CI runs, so it must run without audio
+    hardware (or PortAudio).
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import csv
+import json
+import os
+import subprocess
+import sys
+
+
+#########
+# Setup #
+#########
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def calibrate(*args):
+    """ Run python -m models.calrunnermodel from the project folder
+    """
+    return subprocess.run(
+        [sys.executable, '-m', 'models.calrunnermodel', *map(str, args)],
+        cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+#########
+# Tests #
+#########
+def test_cli_calibrates_and_verifies_routes(tmp_path):
+    out = tmp_path / 'runs.csv'
+    profiles = tmp_path / 'profiles.json'
+
+    result = calibrate('--devices', 0, 1, '--speakers', 1, 2,
+        '--out', out, '--profiles', profiles)
+    assert result.returncode == 0, result.stderr
+
+    with open(out, newline='') as fh:
+        records = list(csv.DictReader(fh))
+    # Two devices x two speakers x three default targets
+    assert len(records) == 12
+    for record in records:
+        assert abs(float(record['error_db'])) < 1e-6
+
+    with open(profiles) as fh:
+        assert len(json.load(fh)['routes']) == 4
@@ -0,0 +1,93 @@
+""" Smoke test for the headless batch exporter: the command line
+    tool must run without audio hardware (or PortAudio).
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import csv
+import os
+import subprocess
+import sys
+
+# Import data science packages
+import numpy as np
+
+# Import audio packages
+import soundfile as sf
+
+
+#########
+# Setup #
+#########
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FS = 48000
+
+
+def export(*args):
+    """ Run python -m models.exportmodel from the project folder
+    """
+    return subprocess.run(
+        [sys.executable, '-m', 'models.exportmodel', *map(str, args)],
+        cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+#########
+# Tests #
+#########
+def test_cli_writes_trains_and_manifest(tmp_path):
+    stim = tmp_path / 'tick.wav'
+    sf.write(stim, np.r_[np.full(48, 0.5), np.zeros(240)], FS)
+    out = tmp_path / 'out'
+
+    result = export(stim, '--isi', 40, 60, '--jitter', 0, 5,
+        '--reps', 3, '--seeds', 1, 2, '--out', out, '--workers', 2)
+    assert result.returncode == 0, result.stderr
+
+    with open(out / 'manifest.csv', newline='') as fh:
+        records = list(csv.DictReader(fh))
+    assert len(records) == 2 * 2 * 2
+    for record in records:
+        sig, fs = sf.read(out / record['file'])
+        assert fs == FS
+        assert len(sig) == int(record['samples'])
+
+
+def test_cli_varies_sources_and_isi_modes(tmp_path):
+    out = tmp_path / 'out'
+
+    result = export('--sources', 'click', 'tone_pip', '--isi-mode',
+        'offset', 'onset', '--isi', 10, '--jitter', 2, '--reps', 4,
+        '--out', out, '--workers', 2)
+    assert result.returncode == 0, result.stderr
+
+    with open(out / 'manifest.csv', newline='') as fh:
+        records = list(csv.DictReader(fh))
+    assert {(r['source'], r['isi_mode']) for r in records} == {
+        ('click', 'offset'), ('click', 'onset'),
+        ('tone_pip', 'offset'), ('tone_pip', 'onset')}
+    for record in records:
+        assert record['stim_file'] == ''
+        sig, fs = sf.read(out / record['file'])
+        assert len(sig) == int(record['samples'])
+
+
+def test_cli_rejects_unrenderable_grid_before_writing(tmp_path):
+    stim = tmp_path / 'tick.wav'
+    sf.write(stim, np.r_[np.full(48, 0.5), np.zeros(240)], FS)
+    out = tmp_path / 'out'
+
+    # Jitter must be less than the ISI in onset mode
+    result = export(stim, '--isi-mode', 'offset', 'onset', '--isi', 5, 40,
+        '--jitter', 10, '--out', out)
+    assert result.returncode == 2
+    assert '1 of 4 combinations' in result.stderr
+    assert 'onset_isi5.0_jitter10.0' in result.stderr
+    assert not out.exists()
+
+
+def test_cli_file_source_needs_a_file(tmp_path):
+    result = export('--out', tmp_path / 'out')
+    assert result.returncode == 2
+    assert 'stimulus file' in result.stderr
@@ -0,0 +1,113 @@
+""" Check that calibration profiles are only stored under real
+    device names, and that the reported SLM offset is the one the
+    calibration curve applies.
+"""
+
+###########
+# Imports #
+###########
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import profilemodel
+
+
+#########
+# Setup #
+#########
+class Devices:
+    """ Device name lookup that can be unplugged
+    """
+    def __init__(self):
+        self.present = True
+
+    def __call__(self, device_id):
+        if not self.present:
+            raise ValueError(f"No device {device_id}")
+        return f"Interface {device_id}"
+
+
+@pytest.fixture
+def devices():
+    return Devices()
+
+
+@pytest.fixture
+def profiles(tmp_path, devices):
+    model = profilemodel.DeviceProfileModel(tmp_path / 'profiles.json',
+        query=devices)
+    # Look devices up again on every call
+    model.NAME_TTL = 0
+    return model
+
+
+#########
+# Tests #
+#########
+def test_routes_use_device_names(profiles):
+    profiles.add_point(3, 1, -20.0, 80.0)
+    assert list(profiles.routes) == ['Interface 3|1']
+
+
+@pytest.mark.parametrize('write', [
+    lambda p: p.add_point(3, 1, -20.0, 80.0),
+    lambda p: p.set_offset(3, 1, 100.0),
+    lambda p: p.set_stream_settings(3, {'blocksize': 256}),
+], ids=['add_point', 'set_offset', 'set_stream_settings'])
+def test_missing_device_is_not_written(profiles, devices, write):
+    devices.present = False
+    with pytest.raises(LookupError):
+        write(profiles)
+    assert profiles.routes == {}
+    assert profiles.devices == {}
+
+
+def test_missing_device_reads_as_uncalibrated(profiles, devices):
+    profiles.add_point(3, 1, -20.0, 80.0)
+    devices.present = False
+    assert profiles.get_route(3, 1) is None
+    assert profiles.get_offset(3, 1, default=95.0) == 95.0
+
+    # Back again: the calibration is found under its name
+    devices.present = True
+    assert profiles.get_offset(3, 1) == pytest.approx(100.0)
+
+
+def test_failed_lookups_are_cached(tmp_path):
+    calls = []
+
+    def missing(device_id):
+        calls.append(device_id)
+        raise ValueError(device_id)
+
+    model = profilemodel.DeviceProfileModel(tmp_path / 'profiles.json',
+        query=missing)
+    for _ in range(5):
+        assert model.device_name(7) is None
+    assert calls == [7]
+
+
+def test_offset_matches_curve(profiles):
+    # A compressing transducer, highest level first: the last
+    # reading alone says 60 - -40 = 100 dB, the curve applies the
+    # offset of its top point (95 dB) at 0 dB FS
+    for dbfs, spl in [(-10.0, 85.0), (-20.0, 80.0), (-40.0, 60.0)]:
+        profiles.add_point(3, 1, dbfs, spl)
+
+    curve = profiles.get_curve(3, 1)
+    offset = float(curve.to_spl(0.0))
+    assert offset == pytest.approx(95.0)
+    assert profiles.get_offset(3, 1) == pytest.approx(offset)
+    assert profiles.get_route(3, 1)['slm_offset'] == pytest.approx(offset)
+
+
+def test_offset_survives_save_and_load(profiles, tmp_path, devices):
+    for dbfs, spl in [(-40.0, 60.0), (-20.0, 80.0), (-10.0, 85.0)]:
+        profiles.add_point(3, 1, dbfs, spl)
+    profiles.save()
+
+    loaded = profilemodel.DeviceProfileModel(tmp_path / 'profiles.json',
+        query=devices)
+    assert loaded.get_offset(3, 1) == pytest.approx(
+        profiles.get_offset(3, 1))
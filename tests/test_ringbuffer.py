@@ -0,0 +1,214 @@
+""" Check the SPSC ring buffer: indexing, counters, gain, and a
+    threaded producer/consumer stress run at different rates.
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import threading
+import tracemalloc
+
+# Import data science packages
+import numpy as np
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import ringbuffermodel
+
+
+#########
+# Funcs #
+#########
+def ramp(start, frames, channels=2):
+    """ Numbered frames start, start + 1, ... (negated on the
+        second channel)
+    """
+    x = np.arange(start, start + frames, dtype=np.float32)
+    return np.column_stack([x, -x])[:, :channels]
+
+
+def stress(capacity, block_in, block_out, writes, reads, steps):
+    """ Producer writes blocks of a ramp (1, 2, 3, ...); consumer
+        reads blocks. In each of steps rounds the producer makes 
+        writes writes while the consumer makes reads reads, both
+        threads running at once; a barrier starts each round, so
+        the run is bounded by counts, not by the clock. The 
+        consumer then drains the ring. Returns the ring, the 
+        frames offered, and everything the consumer got.
+    """
+    ring = ringbuffermodel.RingBuffer(capacity, channels=2)
+    total = block_in * writes * steps
+    data = ramp(1, total)
+    received = []
+    barrier = threading.Barrier(2, timeout=30)
+
+    def producer():
+        blocks = iter(range(writes * steps))
+        for _ in range(steps):
+            barrier.wait()
+            for _ in range(writes):
+                i = next(blocks)
+                ring.write(data[i * block_in:(i + 1) * block_in])
+        barrier.wait()
+
+    def consumer():
+        out = np.empty((block_out, 2), dtype=np.float32)
+        for _ in range(steps):
+            barrier.wait()
+            for _ in range(reads):
+                n = ring.read_into(out)
+                received.append(out[:n].copy())
+        barrier.wait()
+        # The producer has finished: drain what is left
+        while ring.readable:
+            n = ring.read_into(out)
+            received.append(out[:n].copy())
+
+    threads = [threading.Thread(target=producer),
+        threading.Thread(target=consumer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return ring, total, np.concatenate(received)
+
+
+#########
+# Tests #
+#########
+@pytest.mark.parametrize('capacity,size', [
+    (1, 1), (2, 2), (3, 4), (1000, 1024), (1024, 1024), (1025, 2048)])
+def test_capacity_rounds_up_to_power_of_two(capacity, size):
+    ring = ringbuffermodel.RingBuffer(capacity)
+    assert ring.capacity == size
+    assert ring.writable == size
+    assert ring.readable == 0
+
+
+def test_wrap_around():
+    ring = ringbuffermodel.RingBuffer(8, channels=2)
+    out = np.empty((5, 2), dtype=np.float32)
+
+    # Move the indexes to 5, then write across the end
+    ring.write(ramp(1, 5))
+    ring.read_into(out)
+    assert ring.write(ramp(6, 7)) == 7
+    assert ring.readable == 7
+
+    got = np.empty((7, 2), dtype=np.float32)
+    assert ring.read_into(got) == 7
+    assert np.array_equal(got, ramp(6, 7))
+    assert ring.stats() == {'overruns': 0, 'dropped_frames': 0,
+        'underruns': 0, 'missing_frames': 0}
+
+
+def test_mono_write_accepts_1d():
+    ring = ringbuffermodel.RingBuffer(4, channels=1)
+    ring.write(np.array([1, 2, 3], dtype=np.float32))
+    out = np.empty((3, 1), dtype=np.float32)
+    ring.read_into(out)
+    assert np.array_equal(out[:, 0], [1, 2, 3])
+
+
+def test_overrun_drops_and_counts():
+    ring = ringbuffermodel.RingBuffer(8, channels=2)
+    assert ring.write(ramp(1, 6)) == 6
+    assert ring.write(ramp(7, 5)) == 2
+    assert ring.overruns == 1
+    assert ring.dropped_frames == 3
+    assert ring.writable == 0
+
+    # The frames that fit are kept, in order
+    out = np.empty((8, 2), dtype=np.float32)
+    ring.read_into(out)
+    assert np.array_equal(out, ramp(1, 8))
+
+
+def test_underrun_fills_silence_and_counts():
+    ring = ringbuffermodel.RingBuffer(8, channels=2)
+    ring.write(ramp(1, 3))
+    out = np.full((5, 2), 99, dtype=np.float32)
+    assert ring.read_into(out) == 3
+    assert np.array_equal(out[:3], ramp(1, 3))
+    assert np.all(out[3:] == 0)
+    assert ring.underruns == 1
+    assert ring.missing_frames == 2
+
+    # Empty ring: all silence
+    assert ring.read_into(out) == 0
+    assert np.all(out == 0)
+    assert ring.underruns == 2
+    assert ring.missing_frames == 7
+
+
+def test_gain_applies_on_read():
+    ring = ringbuffermodel.RingBuffer(8, channels=2)
+    ring.write(ramp(1, 4))
+    out = np.empty((2, 2), dtype=np.float32)
+
+    ring.read_into(out)
+    assert np.array_equal(out, ramp(1, 2))
+
+    # Changing the gain affects only later reads
+    ring.gain = 0.5
+    ring.read_into(out)
+    assert np.array_equal(out, ramp(3, 2) * 0.5)
+
+
+def test_clear_drops_pending_frames():
+    ring = ringbuffermodel.RingBuffer(8, channels=2)
+    ring.write(ramp(1, 6))
+    ring.clear()
+    assert ring.readable == 0
+    assert ring.writable == 8
+
+    # The ring keeps working after a clear
+    ring.write(ramp(10, 8))
+    out = np.empty((8, 2), dtype=np.float32)
+    assert ring.read_into(out) == 8
+    assert np.array_equal(out, ramp(10, 8))
+
+
+@pytest.mark.parametrize('writes,reads', [
+    (1, 1),     # matched
+    (4, 1),     # producer faster: overruns
+    (1, 4),     # consumer faster: underruns
+], ids=['matched', 'fast-producer', 'fast-consumer'])
+def test_stress(writes, reads):
+    ring, total, got = stress(1024, 256, 256, writes, reads, 400)
+
+    # In order, no repeats, nothing invented, channels kept together
+    assert np.all(np.diff(got[:, 0]) > 0)
+    assert got[:, 0].min() >= 1 and got[:, 0].max() <= total
+    assert np.array_equal(got[:, 1], -got[:, 0])
+    # Everything written was read; what was not written was dropped
+    assert len(got) + ring.dropped_frames == total
+    # Each round offers or asks for more than the ring can hold
+    if writes > reads:
+        assert ring.overruns > 0
+    if reads > writes:
+        assert ring.underruns > 0
+
+
+def test_read_into_does_not_allocate():
+    """ The consumer side must not allocate sample buffers
+    """
+    ring = ringbuffermodel.RingBuffer(4096, channels=2)
+    out = np.empty((256, 2), dtype=np.float32)
+    block = np.ones((256, 2), dtype=np.float32)
+    ring.gain = 0.7
+
+    tracemalloc.start()
+    for _ in range(1000):
+        ring.write(block)
+        ring.read_into(out)
+        # Exercise the wrap-around and the underrun path too
+        ring.read_into(out)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Slices and scalars only: far less than one 256-frame block
+    assert peak < block.nbytes
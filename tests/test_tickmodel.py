@@ -0,0 +1,115 @@
+""" Check tick trains: offset mode must match the original
+    concatenating renderer sample for sample, and each mode
+    accepts the settings it can render.
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import random
+import types
+
+# Import data science packages
+import numpy as np
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import tickmodel
+from functions import headless
+
+
+#########
+# Setup #
+#########
+FS = 48000
+
+
+@pytest.fixture
+def audio():
+    """ A short, asymmetric tick (so misplaced samples show)
+    """
+    signal = np.linspace(1.0, 0.1, 96) * np.sign(np.sin(np.arange(96)))
+    return types.SimpleNamespace(signal=signal, fs=FS)
+
+
+def original_train(audio, isi, jitter, reps):
+    """ The renderer tick trains were made with before overlap-add:
+        tick plus silence, with each jitter draw added to the ISI
+    """
+    isi = isi / 1000
+    jitter = jitter / 1000
+    train = []
+    for _ in range(reps):
+        isi = isi + random.uniform(-jitter, jitter)
+        train.append(np.hstack([audio.signal, np.zeros(int(isi * FS))]))
+    return np.hstack(train)
+
+
+def make_train(audio, **pars):
+    sessionpars = headless.make_sessionpars(**pars)
+    return tickmodel.TickModel(sessionpars, audio).make_train()
+
+
+#########
+# Tests #
+#########
+@pytest.mark.parametrize('isi,jitter,reps,seed', [
+    (60.0, 0.0, 10, 0),
+    (60.0, 0.5, 20, 1),
+    (40.0, 5.0, 50, 2),
+    (10.0, 2.0, 100, 3),
+])
+def test_offset_mode_matches_original(audio, isi, jitter, reps, seed):
+    random.seed(seed)
+    expected = original_train(audio, isi, jitter, reps)
+    random.seed(seed)
+    train = make_train(audio, isi=isi, jitter=jitter, train_reps=reps,
+        isi_mode='offset')
+    assert np.array_equal(train, expected)
+
+
+def test_offset_mode_pinned_onsets(audio):
+    """ Fixed seed, fixed onsets: jitter draws accumulate
+    """
+    random.seed(7)
+    sessionpars = headless.make_sessionpars(isi=10.0, jitter=1.0,
+        train_reps=5, isi_mode='offset')
+    model = tickmodel.TickModel(sessionpars, audio)
+    train = model.make_train()
+    # Values from the original renderer
+    assert model.onsets.tolist() == [0, 559, 1084, 1624, 2123]
+    assert len(train) == 2625
+
+
+def test_offset_mode_allows_back_to_back_ticks(audio):
+    train = make_train(audio, isi=0.0, jitter=0.0, train_reps=3,
+        isi_mode='offset')
+    assert np.array_equal(train, np.tile(audio.signal, 3))
+
+
+@pytest.mark.parametrize('isi,jitter', [(-1.0, 0.0), (10.0, -1.0)])
+def test_offset_mode_rejects_negative_settings(audio, isi, jitter):
+    with pytest.raises(ValueError):
+        make_train(audio, isi=isi, jitter=jitter, isi_mode='offset')
+
+
+def test_onset_mode_jitters_around_nominal(audio):
+    random.seed(0)
+    sessionpars = headless.make_sessionpars(isi=1.0, jitter=0.5,
+        train_reps=2000, isi_mode='onset')
+    model = tickmodel.TickModel(sessionpars, audio)
+    model.make_train()
+    steps = np.diff(model.onsets)
+    # Never drifts: every interval within isi +/- jitter
+    assert steps.min() >= int(0.5 / 1000 * FS)
+    assert steps.max() <= int(1.5 / 1000 * FS)
+
+
+@pytest.mark.parametrize('isi,jitter', [(0.0, 0.0), (10.0, 10.0),
+    (10.0, -1.0)])
+def test_onset_mode_rejects_unrenderable_settings(audio, isi, jitter):
+    with pytest.raises(ValueError):
+        make_train(audio, isi=isi, jitter=jitter, isi_mode='onset')
@@ -0,0 +1,203 @@
+""" Check the streaming version library reader, the version
+    comparison and the fallbacks for unreadable libraries.
+"""
+
+###########
+# Imports #
+###########
+# Import system packages
+import threading
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+from models import updatermodel
+
+
+#########
+# Setup #
+#########
+APP = 'moa_task_fly'
+
+LIBRARIES = {
+    'up_to_date': (
+        "name,version,mandatory\n"
+        "other_app,1.0.0,no\n"
+        "moa_task_fly,0.2.3,no\n"
+    ),
+    'optional_update': (
+        "name,version,mandatory\n"
+        "moa_task_fly,0.3.0,no\n"
+    ),
+    'mandatory_update': (
+        "name,version,mandatory\n"
+        "moa_task_fly,1.0.0,yes\n"
+    ),
+    'numeric_versions': (
+        "name,version,mandatory\n"
+        "other_app,1.9,no\n"
+        "moa_task_fly,1.10,yes\n"
+    ),
+    'integer_versions': (
+        "name,version,mandatory\n"
+        "moa_task_fly,2,no\n"
+    ),
+    'missing_cells': (
+        "name,version,mandatory\n"
+        "other_app,,no\n"
+        "moa_task_fly,0.2.4,\n"
+    ),
+    'boolean_column': (
+        "name,version,mandatory\n"
+        "moa_task_fly,0.2.4,True\n"
+    ),
+    'first_match_wins': (
+        "name,version,mandatory\n"
+        "moa_task_fly,0.2.3,no\n"
+        "moa_task_fly,9.9.9,yes\n"
+    ),
+    'app_not_listed': (
+        "name,version,mandatory\n"
+        "other_app,1.0.0,no\n"
+    ),
+    'byte_order_mark': (
+        "\ufeffname,version,mandatory\n"
+        "moa_task_fly,0.2.3,no\n"
+    ),
+    'blank_lines': (
+        "name,version,mandatory\n"
+        "\n"
+        "moa_task_fly,0.3.0,yes\n"
+        "\n"
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def no_dialogs(monkeypatch):
+    """ Record message boxes instead of showing them
+    """
+    shown = []
+    for kind in ('showerror', 'showwarning', 'showinfo'):
+        monkeypatch.setattr(updatermodel.messagebox, kind,
+            lambda kind=kind, **kw: shown.append(kind))
+    return shown
+
+
+def check(path, version):
+    checker = updatermodel.VersionChecker(path, APP, version)
+    checker.import_version_library(path)
+    checker.check_for_updates()
+    return checker
+
+
+#########
+# Tests #
+#########
+# Library, app version: up to date, then the dialog shown
+DECISIONS = [
+    ('up_to_date', '0.2.3', True, None),
+    ('up_to_date', '0.2.3.0', True, None),
+    ('optional_update', '0.2.3', True, 'showwarning'),
+    ('mandatory_update', '0.2.3', False, 'showerror'),
+    ('mandatory_update', 'v1.0', True, None),
+    ('numeric_versions', '1.10', True, None),
+    ('numeric_versions', '1.1', False, 'showerror'),
+    ('integer_versions', '2', True, None),
+    ('integer_versions', '2.0', True, None),
+    ('missing_cells', '0.2.3', True, None),
+    ('boolean_column', '0.2.3', True, None),
+    ('first_match_wins', '0.2.3', True, None),
+    ('app_not_listed', '0.2.3', True, 'showerror'),
+    ('byte_order_mark', '0.2.3', True, None),
+    ('blank_lines', '0.2.3', False, 'showerror'),
+]
+
+
+@pytest.mark.parametrize('name,version,current,dialog', DECISIONS)
+def test_decision(tmp_path, no_dialogs, name, version, current, dialog):
+    path = tmp_path / 'lib.csv'
+    path.write_text(LIBRARIES[name], encoding='utf-8')
+    checker = check(path, version)
+    assert checker.current is current
+    assert no_dialogs == ([dialog] if dialog else [])
+
+
+def test_cells_are_strings(tmp_path):
+    path = tmp_path / 'lib.csv'
+    path.write_text(LIBRARIES['numeric_versions'], encoding='utf-8')
+    checker = check(path, '1.10')
+    # Not the float 1.1: 1.10 is a later version than 1.9
+    assert checker.app_record == {'name': APP, 'version': '1.10',
+        'mandatory': 'yes'}
+
+
+def test_stops_at_first_match(tmp_path):
+    # Rows past the match are never read, so an undecodable tail
+    # well beyond the read buffer does not matter
+    path = tmp_path / 'lib.csv'
+    with open(path, 'wb') as fh:
+        fh.write(LIBRARIES['up_to_date'].encode('utf-8'))
+        fh.write(b"other_app,1.0.0,no\n" * 20000)
+        fh.write(b"\xff\xfe,\xff,no\n")
+    checker = check(path, '0.2.3')
+    assert checker.app_record['version'] == '0.2.3'
+    assert checker.current is True
+
+
+def test_missing_library(tmp_path):
+    checker = updatermodel.VersionChecker(tmp_path / 'x.csv', APP, '0.2.3')
+    with pytest.raises(FileNotFoundError):
+        checker.import_version_library(tmp_path / 'x.csv')
+
+
+@pytest.mark.parametrize('header', ['app,version,mandatory',
+    'name,version', 'name,mandatory'])
+def test_library_without_required_column(tmp_path, header):
+    path = tmp_path / 'lib.csv'
+    path.write_text(f"{header}\nmoa_task_fly,0.2.3,no\n", encoding='utf-8')
+    checker = updatermodel.VersionChecker(path, APP, '0.2.3')
+    with pytest.raises(KeyError):
+        checker.import_version_library(path)
+
+
+def test_malformed_cache_falls_back(tmp_path, no_dialogs):
+    """ A cached library with a bad header is treated like no
+        cache: warn and let the app run
+    """
+    checker = updatermodel.VersionChecker(tmp_path / 'x.csv', APP, '0.2.3')
+    checker.cache_path = tmp_path / 'version_library_cache.csv'
+    checker.cache_path.write_text("app,version\nmoa_task_fly,0.2.3\n",
+        encoding='utf-8')
+    checker._use_cache()
+    assert checker.current is True
+    assert no_dialogs == ['showwarning']
+
+
+def test_concurrent_cache_copies(tmp_path):
+    """ Stations starting together each copy the library to the
+        cache; none may fail or leave a temp file behind
+    """
+    lib = tmp_path / 'lib.csv'
+    lib.write_text(LIBRARIES['optional_update'] * 200, encoding='utf-8')
+    cache_dir = tmp_path / 'home'
+    cache_dir.mkdir()
+
+    checkers = []
+    for _ in range(16):
+        checker = updatermodel.VersionChecker(lib, APP, '0.2.3')
+        checker.cache_path = cache_dir / 'version_library_cache.csv'
+        checkers.append(checker)
+    threads = [threading.Thread(target=c._fetch) for c in checkers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for checker in checkers:
+        record, error = checker._results.get_nowait()
+        assert error is None
+        assert record['version'] == '0.3.0'
+    assert [p.name for p in cache_dir.iterdir()] == \
+        ['version_library_cache.csv']
@@ -10,11 +10,9 @@ from tkinter import ttk
 
 # Import data science packages
 import numpy as np
-import pandas as pd
-from pandastable import Table
 
 # Import audio packages
-import sounddevice as sd
+from functions.portaudio import sd
 
 
 #########
@@ -79,6 +77,26 @@ class AudioDialog(tk.Toplevel):
             textvariable=self.sessionpars['speaker_number'], width=6)
         ent_deviceID.grid(column=10, row=15, sticky='w', **options_small)
 
+        # Onset scheduling (0: as soon as possible)
+        ttk.Label(lfrm_settings, text="Pre-roll (ms):").grid(
+            column= 5, row=20, sticky='e', **options_small)
+        ent_preroll = ttk.Entry(lfrm_settings, 
+            textvariable=self.sessionpars['presentation_preroll'], width=6)
+        ent_preroll.grid(column=10, row=20, sticky='w', **options_small)
+
+        # Marker (trigger) pulses at each tick onset (0: off)
+        ttk.Label(lfrm_settings, text="Trigger Channel:").grid(
+            column= 5, row=25, sticky='e', **options_small)
+        ent_trigger = ttk.Entry(lfrm_settings, 
+            textvariable=self.sessionpars['trigger_channel'], width=6)
+        ent_trigger.grid(column=10, row=25, sticky='w', **options_small)
+
+        ttk.Label(lfrm_settings, text="Trigger Width (ms):").grid(
+            column= 5, row=30, sticky='e', **options_small)
+        ent_trigger_width = ttk.Entry(lfrm_settings, 
+            textvariable=self.sessionpars['trigger_width'], width=6)
+        ent_trigger_width.grid(column=10, row=30, sticky='w', **options_small)
+
         # Submit button
         btnDeviceID = ttk.Button(self, text="Submit", 
             command=self._on_submit)
@@ -109,6 +127,11 @@ class AudioDialog(tk.Toplevel):
 
 
     def _show_audio_devices(self):
+        # pandas is only needed for this table: import it here so
+        # it is not loaded at startup
+        import pandas as pd
+        from pandastable import Table
+
         # Get and display list of audio devices
         deviceList = sd.query_devices()
         print("\naudioview: Audio Devcie List")
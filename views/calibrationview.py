@@ -37,6 +37,9 @@ class CalibrationDialog(tk.Toplevel):
         self.title("Calibration")
         self.grab_set()
 
+        # Stop calibration playback when the window is closed
+        self.protocol('WM_DELETE_WINDOW', self._on_close)
+
         # Draw widgets
         self._draw_widgets()
 
@@ -139,6 +142,12 @@ class CalibrationDialog(tk.Toplevel):
         btn_stop.grid(column=5, row=15, columnspan=6, 
                       sticky='ew', **options_small)
 
+        # Loop calibration stimulus until stopped
+        chk_loop = ttk.Checkbutton(lfrm_playback, text="Loop until stopped",
+            takefocus=0, variable=self.sessionpars['cal_loop'])
+        chk_loop.grid(column=5, row=20, columnspan=6, sticky='w', 
+                      **options_small)
+
 
         ##########################
         # Measured Level Widgets #
@@ -157,6 +166,12 @@ class CalibrationDialog(tk.Toplevel):
         self.btn_submit.grid(column=5, columnspan=10, row=20, 
             sticky='w', **options_small)
 
+        # Clear previous readings for this device/speaker
+        btn_reset = ttk.Button(lfrm_slm, text="Reset Curve", 
+            command=self._on_reset, takefocus=0)
+        btn_reset.grid(column=5, columnspan=10, row=25, 
+            sticky='w', **options_small)
+
 
     #############
     # FUNCTIONS #
@@ -225,9 +240,24 @@ class CalibrationDialog(tk.Toplevel):
         self.parent.event_generate('<<CalStop>>')
 
 
+    def _on_close(self):
+        """ Stop playback and close the dialog
+        """
+        self._on_stop()
+        self.destroy()
+
+
+    def _on_reset(self):
+        """ Send reset event to controller
+        """
+        print("\ncalibrationview: Sending reset event to controller...")
+        self.parent.event_generate('<<CalibrationReset>>')
+
+
     def _on_submit(self):
         """ Send save event to controller
         """
         print("\ncalibrationview: Sending save event to controller...")
+        self._on_stop()
         self.parent.event_generate('<<CalibrationSubmit>>')
         self.destroy()
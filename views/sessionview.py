@@ -57,6 +57,10 @@ class SessionDialog(tk.Toplevel):
             frm_stimpath = ttk.Labelframe(self, text='Stimulus File Path')
             frm_stimpath.grid(row=15, column=5, **frame_options, ipadx=5, ipady=5)
 
+            # Synthesized stimulus frame
+            frm_synth = ttk.Labelframe(self, text='Synthesized Stimulus')
+            frm_synth.grid(row=20, column=5, **frame_options, sticky='nsew')
+
 
             ##################
             # Create widgets #
@@ -151,6 +155,14 @@ class SessionDialog(tk.Toplevel):
                 textvariable=self.sessionpars['min_start']
                 ).grid(row=20, column=20, sticky='w')
 
+            # ISI measured from tick offset or onset
+            ttk.Label(frm_options, text="ISI From:"
+                ).grid(row=25, column=15, sticky='e', **widget_options)
+            ttk.Combobox(frm_options, width=8, state='readonly',
+                values=['offset', 'onset'],
+                textvariable=self.sessionpars['isi_mode']
+                ).grid(row=25, column=20, sticky='w')
+
             # Write stimulus button
             ttk.Button(frm_options, text="Export as .wav", 
                 command=self._on_export, takefocus=0).grid(row=30, 
@@ -173,6 +185,50 @@ class SessionDialog(tk.Toplevel):
             ttk.Button(frm_stimpath, text="Browse", command=self._get_stimulus_file
                 ).grid(row=35, column=10, sticky='w', pady=(0, 10))
 
+            # Synthesized Stimulus Frame
+            # Source ('file' uses the path above)
+            ttk.Label(frm_synth, text="Source:"
+                ).grid(row=5, column=5, sticky='e', **widget_options)
+            ttk.Combobox(frm_synth, width=8, state='readonly',
+                values=['file', 'click', 'tone_pip', 'noise'],
+                textvariable=self.sessionpars['stim_source']
+                ).grid(row=5, column=10, sticky='w')
+
+            # Sampling rate
+            ttk.Label(frm_synth, text="Sampling Rate (Hz):"
+                ).grid(row=10, column=5, sticky='e', **widget_options)
+            ttk.Entry(frm_synth, width=10, 
+                textvariable=self.sessionpars['synth_fs']
+                ).grid(row=10, column=10, sticky='w')
+
+            # Click duration (clicks are much shorter than pips)
+            ttk.Label(frm_synth, text="Click Duration (ms):"
+                ).grid(row=15, column=5, sticky='e', **widget_options)
+            ttk.Entry(frm_synth, width=10, 
+                textvariable=self.sessionpars['click_dur']
+                ).grid(row=15, column=10, sticky='w')
+
+            # Duration (tone pips and noise bursts)
+            ttk.Label(frm_synth, text="Duration (ms):"
+                ).grid(row=5, column=15, sticky='e', **widget_options)
+            ttk.Entry(frm_synth, width=10, 
+                textvariable=self.sessionpars['synth_dur']
+                ).grid(row=5, column=20, sticky='w')
+
+            # Frequency (tone pips)
+            ttk.Label(frm_synth, text="Frequency (Hz):"
+                ).grid(row=10, column=15, sticky='e', **widget_options)
+            ttk.Entry(frm_synth, width=10, 
+                textvariable=self.sessionpars['synth_freq']
+                ).grid(row=10, column=20, sticky='w')
+
+            # Ramps
+            ttk.Label(frm_synth, text="Ramp (ms):"
+                ).grid(row=15, column=15, sticky='e', **widget_options)
+            ttk.Entry(frm_synth, width=10, 
+                textvariable=self.sessionpars['synth_ramp']
+                ).grid(row=15, column=20, sticky='w')
+
             # Submit button
             btn_submit = ttk.Button(self, text="Submit", command=self._on_submit)
             btn_submit.grid(row=40, column=5, columnspan=2, pady=10)
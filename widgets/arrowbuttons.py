@@ -5,21 +5,10 @@ import tkinter as tk
 from tkinter import ttk
 
 # Import system packages
-import sys
 import os
 
-
-def resource_path(relative_path):
-    """ Get the absolute path to the resource 
-        Works for dev and for PyInstaller
-    """
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
+# Import custom modules
+from functions import assets
 
 
 class ArrowGroup(tk.Frame):
@@ -56,15 +45,12 @@ class ArrowGroup(tk.Frame):
         rows = [0,0,1,1]
         cols = [1,2,1,2]
         for idx, key in enumerate(command_args):
-            img = resource_path('images\\' + image_names[idx])
             btn = ttk.Button(self, takefocus=0,
                 command=command_args[key])
-            # First look for assets in compiled temp location, 
-            # otherwise, look in local directory
-            try:
-                btn.image = tk.PhotoImage(file=img)
-            except:
-                btn.image = tk.PhotoImage(file='assets/images/' + image_names[idx])
+            # Images are shared through the asset registry, which 
+            # looks in the compiled temp location, then locally
+            btn.image = assets.image(
+                os.path.join('images', image_names[idx]), self)
             btn['image'] = btn.image
             btn.grid(row=rows[idx], column=cols[idx], **options)
 